@@ -1,5 +1,7 @@
 import os
 import csv
+import json
+import hashlib
 from flasgger import Swagger
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -7,6 +9,9 @@ from flask import Flask, jsonify
 from flask_jwt_extended import JWTManager
 
 from . import db
+from . import shards
+from . import metrics
+from . import profiling
 from .auth import auth_bp
 from .routes import routes_bp
 
@@ -30,6 +35,40 @@ def load_books_data():
         print(f"Error loading .csv file: {e}")
         return [], False
 
+APISPEC_PATH = os.path.join(os.path.dirname(__file__), 'apispec.json')
+
+def apispec_fingerprint(app):
+    """
+        Hash of the routes and docstrings of the application, the sources of the OpenAPI spec.
+        A precomputed spec is only used while its fingerprint matches the running code.
+    """
+    digest = hashlib.sha256()
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: (rule.rule, rule.endpoint)):
+        view = app.view_functions.get(rule.endpoint)
+        digest.update(f"{rule.rule} {sorted(rule.methods)} {rule.endpoint}\n{getattr(view, '__doc__', '')}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def load_precomputed_apispec(app, swagger):
+    """
+        Loads the OpenAPI spec generated by 'python -m scripts.build_apispec' into the flasgger cache,
+        so the workers do not parse the YAML docstrings of every route.
+        Without the file, or with a stale one, flasgger builds the spec on the first request.
+    """
+    if not os.path.exists(APISPEC_PATH):
+        return False
+    try:
+        with open(APISPEC_PATH, encoding='utf-8') as spec_file:
+            spec = json.load(spec_file)
+    except (OSError, ValueError) as e:
+        print(f"Error loading precomputed OpenAPI spec: {e}")
+        return False
+    # The fingerprint is only used here: it is not part of the served spec.
+    if spec.pop('x-source-fingerprint', None) != apispec_fingerprint(app):
+        print("Precomputed OpenAPI spec is outdated, run 'python -m scripts.build_apispec'.")
+        return False
+    swagger.apispecs['apispec_1'] = spec
+    return True
+
 def create_app():
     """
         Initializes the Flask application, loads configurations, and registers blueprints.
@@ -59,8 +98,28 @@ def create_app():
     }
     swagger = Swagger(app)
     # Database Config
-    app.config['DATABASE_PATH'] = os.path.join('data', 'books.db')
+    app.config['DATABASE_PATH'] = os.environ.get('DATABASE_PATH', os.path.join('data', 'books.db'))
+    # Catalogue shards: the primary database, then one SQLite file per extra source ('name=path=base_url,...')
+    app.config['SHARDS'] = shards.parse_shards(
+        app.config['DATABASE_PATH'], os.environ.get('SCRAPER_BASE_URL'), os.environ.get('DATABASE_SHARDS', '')
+    )
+    # Scraping on boot can be disabled (e.g. benchmarks) with SCRAPE_ON_BOOT=false
+    app.config['SCRAPE_ON_BOOT'] = os.environ.get('SCRAPE_ON_BOOT', 'true').lower() != 'false'
+    # Micro-batching of /predict: batch window (seconds) and maximum predictions per batch
+    app.config['PREDICT_BATCH_WINDOW'] = float(os.environ.get('PREDICT_BATCH_WINDOW', '0.002'))
+    app.config['PREDICT_MAX_BATCH'] = int(os.environ.get('PREDICT_MAX_BATCH', '64'))
+    # /changes/stream: time a connection is held before the client reconnects, and the polling interval (seconds)
+    app.config['CHANGES_STREAM_HOLD'] = float(os.environ.get('CHANGES_STREAM_HOLD', '25'))
+    app.config['CHANGES_POLL_INTERVAL'] = float(os.environ.get('CHANGES_POLL_INTERVAL', '1'))
+    # Concurrent /changes/stream connections per worker process (set by gunicorn.conf.py from its threads)
+    app.config['CHANGES_MAX_STREAMS'] = int(os.environ.get('CHANGES_MAX_STREAMS', '100'))
+    # Local image store written by the scraper (scripts/images.py)
+    app.config['IMAGE_DIR'] = os.environ.get('IMAGE_DIR', os.path.join('data', 'images'))
     db.init_app(app)
+    # Prometheus metrics (/metrics)
+    metrics.init_app(app)
+    # On-demand profiling (X-Profile header and /api/v1/profiling)
+    profiling.init_app(app)
     # Blueprints for routes and authentication
     app.register_blueprint(auth_bp)
     app.register_blueprint(routes_bp)
@@ -79,6 +138,8 @@ def create_app():
                 "status": "ERROR", 
                 "message": "Failed on health check"
             }), 503
+    # OpenAPI spec generated at build time (scripts/build_apispec.py)
+    load_precomputed_apispec(app, swagger)
     return app
 
 if __name__ == '__main__':
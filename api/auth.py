@@ -1,16 +1,18 @@
 # This file implements the authentication for the Flask application.
 
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 
 # Create the authentication blueprint with a URL prefix
 auth_bp = Blueprint('auth_bp', __name__, url_prefix='/api/v1/auth')
 
 # Remove this shit and use a real database
+# The hash is precomputed (generate_password_hash("supersecret")): scrypt takes ~0.1 s,
+# which every worker paid on import.
 USERS_DB = {
   "testuser": {
-      "password_hash": generate_password_hash("supersecret")
+      "password_hash": "scrypt:32768:8:1$KmgJHYCVuFyhT8qH$2376fb60482df195696e785cdb9da87c5be8eccff0f114f2ea97f97e37eb18d454fb826768e5aca17d7ff96d3b20b94a7aa9b3e3466e1857ad2fe2d4b0d7954c"
   }
 }
 
@@ -0,0 +1,51 @@
+# This file implements the in-memory cache of the values computed from the dataset
+# (similarity index, feature matrix, prediction models, facet index), shared by the threads of a worker.
+
+import threading
+from collections import OrderedDict
+
+class DatasetCache:
+  """
+  Values computed from each database (indexes, matrices), kept only for its current dataset version.
+  Each value is built once per worker and key; a new version of a database discards every value of
+  its previous version. Databases (shards) are cached independently.
+  """
+  def __init__(self):
+    # db_path -> (version, {key: value})
+    self._databases = {}
+    # Reentrant: a build may get other values of the same version (the models share a training set).
+    self._lock = threading.RLock()
+
+  def get(self, db_path, version, key, build):
+    cached_version, values = self._databases.get(db_path, (None, {}))
+    if cached_version == version and key in values:
+      return values[key]
+    with self._lock:
+      cached_version, values = self._databases.get(db_path, (None, {}))
+      if cached_version != version:
+        values = {}
+        self._databases[db_path] = (version, values)
+      if key not in values:
+        values[key] = build()
+      return values[key]
+
+class LRUCache:
+  """
+  At most 'maxsize' values, for values too large to keep one per key (e.g. one per request parameter).
+  The least recently used value is discarded when a new one is built.
+  """
+  def __init__(self, maxsize):
+    self.maxsize = maxsize
+    self._values = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key, build):
+    with self._lock:
+      if key in self._values:
+        self._values.move_to_end(key)
+        return self._values[key]
+      value = build()
+      self._values[key] = value
+      while len(self._values) > self.maxsize:
+        self._values.popitem(last=False)
+      return value
@@ -1,21 +1,39 @@
 import os
 import sqlite3
-from scripts import scraper
+import threading
 from flask import current_app, g
 
+from . import metrics
+
+def connect(db_path):
+    """
+    Abre uma nova conexão com o banco de dados 'db_path'.
+    Usada diretamente por quem precisa de uma conexão fora do ciclo da requisição (ex.: respostas em streaming).
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database not found at: {db_path}.")
+    # A conexão instrumentada registra o tempo e as linhas de cada query em /metrics.
+    conn = sqlite3.connect(db_path, factory=metrics.InstrumentedConnection)
+    conn.row_factory = sqlite3.Row
+    metrics.DB_CONNECTIONS.inc()
+    return conn
+
 def get_db():
     """
     Cria e retorna uma conexão com o banco de dados para a requisição atual.
     A conexão é armazenada no objeto 'g' do Flask, que é único para cada requisição.
     """
     if 'db' not in g:
-        db_path = current_app.config['DATABASE_PATH']
-        if not os.path.exists(db_path):
-            raise FileNotFoundError(f"Database not found at: {db_path}.")     
-        g.db = sqlite3.connect(db_path)
-        g.db.row_factory = sqlite3.Row
+        g.db = connect(current_app.config['DATABASE_PATH'])
     return g.db
 
+def get_dataset_version(conn=None):
+    """
+    Retorna a versão do conjunto de dados (PRAGMA user_version do banco).
+    O scraper incrementa a versão a cada gravação que altera a tabela 'books'.
+    """
+    return (conn or get_db()).execute('PRAGMA user_version').fetchone()[0]
+
 def close_db(e=None):
     """Fecha a conexão com o banco de dados ao final da requisição."""
     db = g.pop('db', None)
@@ -26,6 +44,34 @@ def init_app(app):
     """
     Registra a função de fechamento do banco de dados com a aplicação Flask.
     Isso garante que close_db() seja chamada após cada requisição.
+    O scraping inicial só é executado se SCRAPE_ON_BOOT estiver habilitado.
+    Cada shard é extraído em paralelo, na sua própria thread e no seu próprio banco.
+    Os bancos existentes recebem as tabelas criadas por versões mais novas ('book_changes', 'images').
     """
-    scraper.run_scraping_process()
+    from scripts import schema
+    for shard in app.config['SHARDS']:
+        if not os.path.exists(shard.path):
+            continue
+        try:
+            conn = sqlite3.connect(shard.path)
+            try:
+                schema.create_tables(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Error updating the schema of {shard.path}: {e}")
+    if app.config.get('SCRAPE_ON_BOOT', True):
+        # Importado apenas aqui: requests/bs4 não são carregados quando o scraping não é executado.
+        from scripts import scraper
+        from . import shards
+        scrape_threads = [
+            threading.Thread(
+                target=scraper.run_scraping_process, args=(shard.base_url, shard.path), name=shards.scraping_thread_name(shard)
+            )
+            for shard in app.config['SHARDS']
+        ]
+        for scrape_thread in scrape_threads:
+            scrape_thread.start()
+        for scrape_thread in scrape_threads:
+            scrape_thread.join()
     app.teardown_appcontext(close_db)
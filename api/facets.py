@@ -0,0 +1,103 @@
+# This file implements the facet counts of /books/search.
+#
+# The category, rating and price bucket of every book are kept in NumPy arrays (a columnar facet index),
+# built once per worker and dataset version. The search query only returns the IDs that match the filter,
+# and all the facets are counted from them with np.bincount, so the filter is evaluated a single time.
+
+import numpy as np
+
+from .cache import DatasetCache
+
+# Width of the price buckets, in pounds.
+PRICE_BUCKET = 10
+
+class FacetIndex:
+  """
+  Columnar index of the facets of a books dataset.
+  'rows' is a list of (id, category, rating, price) rows ordered by id.
+  """
+  def __init__(self, rows, version=None):
+    self.version = version
+    ids, categories, ratings, prices = zip(*rows) if rows else ((),) * 4
+    self.ids = np.asarray(ids, dtype=np.int64)
+    # Categories are encoded in the order they appear (a dictionary lookup per book, faster than np.unique on strings).
+    codes = {}
+    self.category_codes = np.fromiter(
+      (codes.setdefault(category, len(codes)) for category in categories), dtype=np.int64, count=len(categories)
+    )
+    self.categories = [str(category) for category in codes]
+    # Books without rating are counted as 0 stars.
+    self.ratings = np.nan_to_num(np.asarray(ratings, dtype=np.float64)).astype(np.int64)
+    self.prices = np.asarray(prices, dtype=np.float64)
+    self.price_buckets = np.floor(self.prices / PRICE_BUCKET).astype(np.int64).clip(0)
+
+  def partial_counts(self, book_ids):
+    """
+    Raw facet counts of the books 'book_ids' (positions of this index), mergeable across shards
+    with merge_counts().
+    """
+    book_ids = np.asarray(book_ids, dtype=np.int64)
+    positions = np.searchsorted(self.ids, book_ids).clip(0, max(len(self.ids) - 1, 0))
+    positions = positions[self.ids[positions] == book_ids] if len(self.ids) else positions[:0]
+    codes = self.category_codes[positions]
+    books_per_category = np.bincount(codes, minlength=len(self.categories))
+    price_per_category = np.bincount(codes, weights=self.prices[positions], minlength=len(self.categories))
+    books_per_rating = np.bincount(self.ratings[positions])
+    books_per_bucket = np.bincount(self.price_buckets[positions])
+    return {
+      'total_books': len(positions),
+      'total_price': float(self.prices[positions].sum()),
+      'categories': {
+        self.categories[code]: (int(books_per_category[code]), float(price_per_category[code]))
+        for code in np.nonzero(books_per_category)[0]
+      },
+      'ratings': {int(rating): int(books_per_rating[rating]) for rating in np.nonzero(books_per_rating)[0]},
+      'prices': {int(bucket): int(books_per_bucket[bucket]) for bucket in np.nonzero(books_per_bucket)[0]}
+    }
+
+  def counts(self, book_ids):
+    """
+    Facet counts of the books 'book_ids', in the format of /stats/categories and /stats/overview.
+    """
+    return merge_counts([self.partial_counts(book_ids)])
+
+def merge_counts(partials):
+  """
+  Merges the partial counts of several shards (sums of books and prices) and formats them
+  like /stats/categories and /stats/overview.
+  """
+  total_books, total_price = 0, 0.0
+  categories, ratings, prices = {}, {}, {}
+  for partial in partials:
+    total_books += partial['total_books']
+    total_price += partial['total_price']
+    for name, (books, price) in partial['categories'].items():
+      merged = categories.setdefault(name, [0, 0.0])
+      merged[0] += books
+      merged[1] += price
+    for rating, books in partial['ratings'].items():
+      ratings[rating] = ratings.get(rating, 0) + books
+    for bucket, books in partial['prices'].items():
+      prices[bucket] = prices.get(bucket, 0) + books
+  return {
+    'total_books': total_books,
+    'average_price': f"£{round(total_price / total_books, 2) if total_books else 0}",
+    'categories': {
+      name: {'books': books, 'average_price': f"£{round(price / books, 2)}"} for name, (books, price) in categories.items()
+    },
+    'ratings': {f"{rating} estrela(s)": ratings[rating] for rating in sorted(ratings)},
+    'prices': [
+      {'min': bucket * PRICE_BUCKET, 'max': (bucket + 1) * PRICE_BUCKET, 'books': prices[bucket]}
+      for bucket in sorted(prices)
+    ]
+  }
+
+_cache = DatasetCache()
+
+def get_facet_index(conn, db_path, version):
+  """
+  Returns the facet index of the database 'db_path', rebuilt only when the dataset version changes.
+  """
+  def build():
+    return FacetIndex(conn.execute('SELECT id, category, rating, price FROM books ORDER BY id').fetchall(), version)
+  return _cache.get(db_path, version, 'facets', build)
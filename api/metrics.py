@@ -0,0 +1,164 @@
+# This file implements the Prometheus metrics of the Flask application.
+#
+# With gunicorn, every worker writes its samples to PROMETHEUS_MULTIPROC_DIR (set in gunicorn.conf.py)
+# and /metrics aggregates the files of all workers. Without it (e.g. 'python -m api.app'),
+# the default in-process registry is used.
+
+import os
+import re
+import time
+import sqlite3
+from flask import Blueprint, Response, request, g
+from prometheus_client import (
+  CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+REQUEST_LATENCY = Histogram(
+  'books_api_request_duration_seconds', 'Request latency per route.', ['method', 'route', 'status']
+)
+RESPONSE_BYTES = Histogram(
+  'books_api_response_bytes', 'Response body size per route.', ['method', 'route'],
+  buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+)
+SQL_DURATION = Histogram(
+  'books_api_sql_duration_seconds', 'SQL execution time per statement and phase (execute/fetch).',
+  ['statement', 'phase'], buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+SQL_ROWS = Counter('books_api_sql_rows_returned_total', 'Rows returned per statement.', ['statement'])
+PREDICTION_BATCH_SIZE = Histogram(
+  'books_api_prediction_batch_size', 'Predictions per micro-batch (/predict).',
+  buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+DB_CONNECTIONS = Counter('books_api_db_connections_opened_total', 'Connections opened by db.get_db().')
+
+# Column lists and IN (...) placeholders vary per request ('fields', batch lookups);
+# they are collapsed so each statement keeps a single label.
+_COLUMN_LIST = re.compile(r'^SELECT (?:\*|\w+(?:, \w+)*) FROM', re.IGNORECASE)
+_PLACEHOLDERS = re.compile(r'\(\?(?:, \?)*\)')
+
+def normalize_statement(sql):
+  """
+  Returns the label of a SQL statement: single spaced, without variable column lists and placeholders.
+  """
+  statement = ' '.join(sql.split())
+  statement = _COLUMN_LIST.sub('SELECT <columns> FROM', statement)
+  statement = _PLACEHOLDERS.sub('(?...)', statement)
+  return statement[:200]
+
+class InstrumentedCursor(sqlite3.Cursor):
+  """
+  Cursor that records the execution and fetch time of each statement and the rows it returned.
+  Rows read by iterating the cursor are recorded together when the iteration ends (or the cursor is reused).
+  """
+  def execute(self, sql, parameters=()):
+    self._observe_iteration()
+    self.statement = normalize_statement(sql)
+    start = time.perf_counter()
+    try:
+      return super().execute(sql, parameters)
+    finally:
+      SQL_DURATION.labels(self.statement, 'execute').observe(time.perf_counter() - start)
+
+  def fetchone(self):
+    start = time.perf_counter()
+    row = super().fetchone()
+    self._observe_fetch(start, 0 if row is None else 1)
+    return row
+
+  def fetchall(self):
+    start = time.perf_counter()
+    rows = super().fetchall()
+    self._observe_fetch(start, len(rows))
+    return rows
+
+  def fetchmany(self, size=None):
+    start = time.perf_counter()
+    rows = super().fetchmany(self.arraysize if size is None else size)
+    self._observe_fetch(start, len(rows))
+    return rows
+
+  def __next__(self):
+    start = time.perf_counter()
+    try:
+      row = super().__next__()
+    except StopIteration:
+      self._iteration_time = getattr(self, '_iteration_time', 0.0) + time.perf_counter() - start
+      self._observe_iteration()
+      raise
+    self._iteration_time = getattr(self, '_iteration_time', 0.0) + time.perf_counter() - start
+    self._iteration_rows = getattr(self, '_iteration_rows', 0) + 1
+    return row
+
+  def close(self):
+    self._observe_iteration()
+    super().close()
+
+  def _observe_iteration(self):
+    # A single sample per iteration, with the total fetch time and rows.
+    if getattr(self, '_iteration_time', None) is None:
+      return
+    statement = getattr(self, 'statement', 'unknown')
+    SQL_DURATION.labels(statement, 'fetch').observe(self._iteration_time)
+    SQL_ROWS.labels(statement).inc(getattr(self, '_iteration_rows', 0))
+    self._iteration_time = None
+    self._iteration_rows = 0
+
+  def _observe_fetch(self, start, rows):
+    statement = getattr(self, 'statement', 'unknown')
+    SQL_DURATION.labels(statement, 'fetch').observe(time.perf_counter() - start)
+    SQL_ROWS.labels(statement).inc(rows)
+
+class InstrumentedConnection(sqlite3.Connection):
+  """
+  Connection whose cursors (including the ones created by conn.execute()) are InstrumentedCursor.
+  """
+  def cursor(self, factory=InstrumentedCursor):
+    return super().cursor(factory)
+
+  def execute(self, sql, parameters=()):
+    return self.cursor().execute(sql, parameters)
+
+def _start_timer():
+  g.metrics_start = time.perf_counter()
+
+def _record_request(response):
+  start = g.pop('metrics_start', None)
+  route = request.url_rule.rule if request.url_rule else 'unmatched'
+  if start is not None:
+    REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(time.perf_counter() - start)
+  # Streamed responses have no known length.
+  if response.content_length is not None:
+    RESPONSE_BYTES.labels(request.method, route).observe(response.content_length)
+  return response
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+  """
+  Prometheus metrics.
+  Returns the metrics of all gunicorn workers in the Prometheus text format.
+  ---
+  tags:
+    - Monitoring
+  security: []
+  produces:
+    - text/plain
+  responses:
+    200:
+      description: Metrics in the Prometheus text format.
+  """
+  if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+  else:
+    registry = REGISTRY
+  return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+def init_app(app):
+  """
+  Registers the request timing hooks and the /metrics endpoint.
+  """
+  app.before_request(_start_timer)
+  app.after_request(_record_request)
+  app.register_blueprint(metrics_bp)
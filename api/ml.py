@@ -0,0 +1,469 @@
+# This file implements the machine learning features of the API.
+#
+# Similar books: every book is represented by a TF-IDF vector of the hashed character n-grams of its
+# title, a one-hot category, its rating and its price. Similarity is the cosine between those vectors,
+# scored with NumPy/SciPy over candidate books only (books that share the category or the most
+# selective title n-grams), and the top-k is selected with argpartition.
+# The index lives in memory, in each worker, and is rebuilt only when the dataset version changes.
+#
+# Feature matrix: numeric features of every book (encoded category, rating, price, availability and
+# optional title hashes), served as a .npy file for training pipelines and cached per dataset version.
+#
+# Predictions: Naive Bayes classifiers (rating, price band) trained on the title n-grams and the category,
+# once per worker and dataset version (model registry). Concurrent single predictions are grouped by a
+# background thread into micro-batches (up to 'max_batch' predictions or 'window' seconds), so the
+# model runs one vectorized product per batch instead of one per request.
+
+import io
+import os
+import time
+import queue
+import threading
+import numpy as np
+import scipy.sparse as sp
+
+from . import metrics
+from .cache import DatasetCache, LRUCache
+
+NGRAM_SIZE = 3
+HASH_FEATURES = 2 ** 18
+MAX_TITLE_BYTES = 128
+# N-grams present in more titles than this fraction carry no information ("the", "of"...) and are ignored.
+MAX_DOCUMENT_FREQUENCY = 0.1
+# Maximum number of books gathered from title posting lists per query (besides the query category).
+CANDIDATE_BUDGET = 20_000
+# Rows hashed at a time, to bound the memory used while building the index.
+CHUNK_SIZE = 100_000
+# Weight of each feature group in the book vector.
+WEIGHTS = {'title': 1.0, 'category': 0.5, 'rating': 0.25, 'price': 0.25}
+# Feature matrices with title hashes kept per worker. They are much larger than the base columns
+# (cached once per dataset version), so only the most recently requested sizes are kept.
+FEATURE_MATRICES_CACHED = 2
+# Hashed title n-gram columns of the prediction models.
+PREDICTION_HASH_FEATURES = 2 ** 16
+# Number of price bands (quantiles of the price) predicted by the 'price_band' model.
+PRICE_BANDS = 4
+
+def hash_title_ngrams(titles, n_features=HASH_FEATURES):
+  """
+  Counts the character n-grams of each title, hashed into 'n_features' columns.
+  Returns a CSR matrix (len(titles), n_features) of float32 counts, computed with vectorized NumPy ops.
+  """
+  chunks = []
+  for start in range(0, len(titles), CHUNK_SIZE):
+    # Fixed width byte matrix, as wide as the longest title of the chunk.
+    encoded = np.array(
+      [f' {title.lower()} '.encode('utf-8')[:MAX_TITLE_BYTES] for title in titles[start:start + CHUNK_SIZE]]
+    )
+    width = encoded.dtype.itemsize
+    text = encoded.view(np.uint8).reshape(len(encoded), width)
+    lengths = np.char.str_len(encoded)
+    rows, positions = np.nonzero(np.arange(max(width - NGRAM_SIZE + 1, 0)) <= (lengths[:, None] - NGRAM_SIZE))
+    # Each n-gram of bytes becomes one integer, spread over the columns by a multiplicative hash
+    # (uint32 products wrap around, i.e. modulo 2 ** 32).
+    codes = (
+      text[rows, positions].astype(np.uint32) << np.uint32(16)
+      | text[rows, positions + 1].astype(np.uint32) << np.uint32(8)
+      | text[rows, positions + 2]
+    )
+    hashed = (codes * np.uint32(2654435761)) % np.uint32(n_features)
+    counts = sp.csr_matrix(
+      (np.ones(len(rows), dtype=np.float32), (rows, hashed.astype(np.int64))),
+      shape=(len(encoded), n_features)
+    )
+    counts.sum_duplicates()
+    chunks.append(counts)
+  if not chunks:
+    return sp.csr_matrix((0, n_features), dtype=np.float32)
+  return sp.vstack(chunks, format='csr')
+
+class SimilarBooksIndex:
+  """
+  In-memory similarity index of a books dataset.
+  'rows' is a list of (id, title, category, rating, price) tuples ordered by id.
+  """
+  def __init__(self, rows, version=None):
+    self.version = version
+    self._scratch = threading.local()
+    ids, titles, categories, ratings, prices = zip(*rows) if rows else ((), (), (), (), ())
+    self.ids = np.asarray(ids, dtype=np.int64)
+    total_books = len(self.ids)
+    # Title: sublinear TF-IDF, L2 normalized.
+    counts = hash_title_ngrams(list(titles))
+    document_frequency = np.bincount(counts.indices, minlength=HASH_FEATURES)
+    idf = (np.log((1 + total_books) / (1 + document_frequency)) + 1).astype(np.float32)
+    idf[document_frequency > max(1, MAX_DOCUMENT_FREQUENCY * total_books)] = 0
+    counts.data = (1 + np.log(counts.data)) * idf[counts.indices]
+    counts.eliminate_zeros()
+    title_norms = np.sqrt(np.asarray(counts.multiply(counts).sum(axis=1)).ravel())
+    title_norms[title_norms == 0] = 1
+    self.titles = sp.csr_matrix(sp.diags(1 / title_norms.astype(np.float32)) @ counts)
+    # Inverted index (n-grams x books): row 'f' lists the books that contain the n-gram 'f'.
+    self.postings = self.titles.T.tocsr()
+    has_title = (self.titles.getnnz(axis=1) > 0).astype(np.float32)
+    # Category: integer codes, and the books of each category (posting lists) for candidate generation.
+    self.categories, self.category_codes = np.unique(np.asarray(categories, dtype=object).astype(str), return_inverse=True)
+    order = np.argsort(self.category_codes, kind='stable')
+    bounds = np.searchsorted(self.category_codes[order], np.arange(len(self.categories) + 1))
+    self.books_by_category = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.categories))]
+    # Rating and price, scaled to [0, 1].
+    self.ratings = ((np.asarray(ratings, dtype=np.float32) - 1) / 4).clip(0, 1)
+    log_prices = np.log1p(np.asarray(prices, dtype=np.float32))
+    price_range = (log_prices.max() - log_prices.min()) if total_books else 0
+    self.prices = (log_prices - log_prices.min()) / price_range if price_range else np.zeros_like(log_prices)
+    # Norm of the weighted book vector, used by the cosine.
+    self.norms = np.sqrt(
+      WEIGHTS['title'] ** 2 * has_title + WEIGHTS['category'] ** 2
+      + (WEIGHTS['rating'] * self.ratings) ** 2 + (WEIGHTS['price'] * self.prices) ** 2
+    ).astype(np.float32)
+
+  def __len__(self):
+    return len(self.ids)
+
+  def rows_of(self, book_ids):
+    """
+    Positions of 'book_ids' in the index (-1 for unknown IDs, including the ones that do not fit in an int64).
+    """
+    limits = np.iinfo(np.int64)
+    in_range = np.asarray([limits.min <= book_id <= limits.max for book_id in book_ids], dtype=bool)
+    book_ids = np.asarray([book_id if valid else 0 for book_id, valid in zip(book_ids, in_range)], dtype=np.int64)
+    positions = np.searchsorted(self.ids, book_ids).clip(0, max(len(self.ids) - 1, 0))
+    found = (self.ids[positions] == book_ids) & in_range if len(self.ids) else np.zeros(len(book_ids), dtype=bool)
+    return np.where(found, positions, -1)
+
+  def similar(self, book_ids, k=10):
+    """
+    Top 'k' similar books of each book in 'book_ids' (batched).
+    Returns a list with, for each input ID, a list of (id, score) sorted by score, or None for unknown IDs.
+    """
+    return [None if row < 0 else self._top_k(row, k) for row in self.rows_of(book_ids)]
+
+  def _unique(self, books):
+    # Removes duplicated positions in O(n), without sorting: each position keeps only its last occurrence.
+    # The scratch array is per thread and never needs to be cleared, because every position read was just written.
+    scratch = getattr(self._scratch, 'slots', None)
+    if scratch is None:
+      scratch = self._scratch.slots = np.empty(len(self.ids), dtype=np.int64)
+    order = np.arange(len(books))
+    scratch[books] = order
+    return books[scratch[books] == order]
+
+  def _candidates(self, row):
+    # Books that share the query category, or its most selective title n-grams (shortest posting
+    # lists first) while they fit in CANDIDATE_BUDGET books.
+    start, end = self.titles.indptr[row], self.titles.indptr[row + 1]
+    ngrams = self.titles.indices[start:end]
+    lengths = self.postings.indptr[ngrams + 1] - self.postings.indptr[ngrams]
+    books, gathered = [self.books_by_category[self.category_codes[row]]], 0
+    for ngram, length in sorted(zip(ngrams, lengths), key=lambda item: item[1]):
+      if gathered + length > CANDIDATE_BUDGET:
+        break
+      books.append(self.postings.indices[self.postings.indptr[ngram]:self.postings.indptr[ngram + 1]])
+      gathered += length
+    candidates = self._unique(np.concatenate(books))
+    return candidates[candidates != row]
+
+  def _top_k(self, row, k):
+    candidates = self._candidates(row)
+    if len(candidates) == 0:
+      return []
+    # Exact cosine of the candidates: title TF-IDF dot product plus the category, rating and price terms.
+    query = np.zeros(self.titles.shape[1], dtype=np.float32)
+    start, end = self.titles.indptr[row], self.titles.indptr[row + 1]
+    query[self.titles.indices[start:end]] = self.titles.data[start:end]
+    scores = WEIGHTS['title'] ** 2 * (self.titles[candidates] @ query)
+    scores += WEIGHTS['category'] ** 2 * (self.category_codes[candidates] == self.category_codes[row])
+    scores += WEIGHTS['rating'] ** 2 * self.ratings[candidates] * self.ratings[row]
+    scores += WEIGHTS['price'] ** 2 * self.prices[candidates] * self.prices[row]
+    scores /= self.norms[candidates] * self.norms[row]
+    k = min(k, len(candidates))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return [(int(self.ids[candidates[i]]), round(float(scores[i]), 4)) for i in top]
+
+_cache = DatasetCache()
+
+def get_similar_books_index(conn, db_path, version):
+  """
+  Returns the similarity index of the database 'db_path', building it on the first call
+  and rebuilding it only when the dataset version changes.
+  """
+  def build():
+    rows = conn.execute('SELECT id, title, category, rating, price FROM books ORDER BY id').fetchall()
+    return SimilarBooksIndex([tuple(row) for row in rows], version)
+  return _cache.get(db_path, version, 'similar_books', build)
+
+def build_feature_matrix(rows):
+  """
+  Builds the feature matrix of the books, with vectorized NumPy ops.
+  'rows' is a list of (id, category, rating, price, availability) tuples ordered by id.
+  Returns a tuple (matrix, manifest): 'matrix' is a structured array (one named column per feature)
+  and 'manifest' describes its columns and the category encoding.
+  """
+  ids, categories, ratings, prices, availability = zip(*rows) if rows else ((),) * 5
+  categories_list, category_codes = np.unique(np.asarray(categories, dtype=object).astype(str), return_inverse=True)
+  # Availability is stored as text; anything that is not a number counts as 0 books available.
+  availability = np.asarray(availability, dtype=object).astype(str)
+  numeric = np.char.isdigit(availability)
+  available = np.zeros(len(availability), dtype=np.int32)
+  available[numeric] = availability[numeric].astype(np.int32)
+  columns = [
+    ('id', '<i8', 'Book ID.'),
+    ('category', '<i4', "Category code, index of the manifest 'categories' list."),
+    ('rating', '<f4', 'Rating, from 1 to 5.'),
+    ('price', '<f4', 'Price, in pounds.'),
+    ('availability', '<i4', 'Number of books in stock.')
+  ]
+  matrix = np.zeros(len(ids), dtype=[(name, column_dtype) for name, column_dtype, _ in columns])
+  matrix['id'] = ids
+  matrix['category'] = category_codes
+  matrix['rating'] = np.asarray(ratings, dtype=np.float32)
+  matrix['price'] = np.asarray(prices, dtype=np.float32)
+  matrix['availability'] = available
+  manifest = {
+    'rows': len(matrix),
+    'format': 'npy',
+    'dtype': np.lib.format.dtype_to_descr(matrix.dtype),
+    'columns': [
+      {'name': name, 'dtype': column_dtype, 'shape': [], 'description': description}
+      for name, column_dtype, description in columns
+    ],
+    'categories': categories_list.tolist()
+  }
+  return matrix, manifest
+
+def add_title_hash(matrix, manifest, titles, text_hash_features):
+  """
+  Returns a copy of the feature matrix (and manifest) with the 'title_hash' column: the counts of the
+  title n-grams of each book ('titles', in the order of the rows) hashed into 'text_hash_features' buckets.
+  """
+  hashed = np.zeros(len(matrix), dtype=matrix.dtype.descr + [('title_hash', '<f4', (text_hash_features,))])
+  for name in matrix.dtype.names:
+    hashed[name] = matrix[name]
+  hashed['title_hash'] = hash_title_ngrams(titles, text_hash_features).toarray()
+  description = f'Counts of the title character {NGRAM_SIZE}-grams, hashed into {text_hash_features} buckets.'
+  hashed_manifest = {
+    **manifest,
+    'dtype': np.lib.format.dtype_to_descr(hashed.dtype),
+    'columns': manifest['columns'] + [
+      {'name': 'title_hash', 'dtype': '<f4', 'shape': [text_hash_features], 'description': description}
+    ]
+  }
+  return hashed, hashed_manifest
+
+_feature_matrices = LRUCache(FEATURE_MATRICES_CACHED)
+
+def get_feature_matrix(conn, db_path, version, text_hash_features=0):
+  """
+  Returns the (matrix, manifest) of the database 'db_path'. The base columns are cached per dataset version;
+  the matrices with title hashes are built from them and only the most recently used ones are cached.
+  """
+  def build():
+    rows = conn.execute('SELECT id, category, rating, price, availability FROM books ORDER BY id').fetchall()
+    matrix, manifest = build_feature_matrix([tuple(row) for row in rows])
+    manifest['version'] = version
+    return matrix, manifest
+  matrix, manifest = _cache.get(db_path, version, 'features', build)
+  if not text_hash_features:
+    return matrix, manifest
+
+  def build_hashed():
+    rows = conn.execute('SELECT id, title FROM books ORDER BY id').fetchall()
+    # The titles are read after the base columns: the rows must still be the same books.
+    if len(rows) != len(matrix) or not np.array_equal(np.fromiter((row[0] for row in rows), np.int64, len(rows)), matrix['id']):
+      raise RuntimeError('The dataset changed while the feature matrix was built.')
+    return add_title_hash(matrix, manifest, [row[1] for row in rows], text_hash_features)
+  return _feature_matrices.get((db_path, version, text_hash_features), build_hashed)
+
+def npy_chunks(matrix, chunk_rows=65536):
+  """
+  Yields 'matrix' in the .npy format (header, then the rows in chunks), so it can be streamed.
+  """
+  header = io.BytesIO()
+  np.lib.format.write_array_header_1_0(header, np.lib.format.header_data_from_array_1_0(matrix))
+  yield header.getvalue()
+  for start in range(0, len(matrix), chunk_rows):
+    yield matrix[start:start + chunk_rows].tobytes()
+
+def npy_size(matrix):
+  """
+  Size in bytes of 'matrix' in the .npy format.
+  """
+  header = io.BytesIO()
+  np.lib.format.write_array_header_1_0(header, np.lib.format.header_data_from_array_1_0(matrix))
+  return len(header.getvalue()) + matrix.nbytes
+
+class NaiveBayesClassifier:
+  """
+  Multinomial Naive Bayes over the hashed title n-grams and the category (one-hot) of a book.
+  'targets' are the class indexes (0 to len(labels) - 1) of the training books.
+  """
+  def __init__(self, name, title_counts, categories, targets, labels, version=None, alpha=1.0):
+    self.name = name
+    self.version = version
+    self.labels = list(labels)
+    self.category_index = {category: i for i, category in enumerate(sorted(set(categories)))}
+    features = self._with_categories(title_counts, categories)
+    classes = sp.csr_matrix(
+      (np.ones(len(targets), dtype=np.float32), (np.arange(len(targets)), np.asarray(targets, dtype=np.int64))),
+      shape=(len(targets), len(self.labels))
+    )
+    class_totals = np.asarray(classes.sum(axis=0)).ravel()
+    feature_counts = np.asarray((classes.T @ features).todense(), dtype=np.float64) + alpha
+    self.log_priors = np.log((class_totals + alpha) / (class_totals.sum() + alpha * len(self.labels))).astype(np.float32)
+    # (features x classes), so a batch is scored with one sparse x dense product.
+    self.log_likelihoods = np.log(feature_counts / feature_counts.sum(axis=1, keepdims=True)).T.astype(np.float32)
+
+  def _with_categories(self, title_counts, categories):
+    # Unknown categories get no category column.
+    codes = np.array([self.category_index.get(category, -1) for category in categories], dtype=np.int64)
+    known = np.nonzero(codes >= 0)[0]
+    category_columns = sp.csr_matrix(
+      (np.ones(len(known), dtype=np.float32), (known, codes[known])),
+      shape=(len(codes), len(self.category_index))
+    )
+    return sp.hstack([title_counts, category_columns], format='csr')
+
+  def predict(self, titles, categories):
+    """
+    Predicts the class of each (title, category) pair (vectorized).
+    Returns a list of {'prediction', 'probabilities'} dictionaries.
+    """
+    features = self._with_categories(hash_title_ngrams(list(titles), PREDICTION_HASH_FEATURES), categories)
+    log_joint = features @ self.log_likelihoods + self.log_priors
+    probabilities = np.exp(log_joint - log_joint.max(axis=1, keepdims=True))
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    return [
+      {
+        'prediction': self.labels[best],
+        'probabilities': {label: round(float(p), 4) for label, p in zip(self.labels, row)}
+      }
+      for best, row in zip(probabilities.argmax(axis=1), probabilities)
+    ]
+
+def _train_rating(training_set, version):
+  title_counts, categories, ratings, _ = training_set
+  labels = [1, 2, 3, 4, 5]
+  targets = np.clip(np.asarray(ratings, dtype=np.int64), 1, 5) - 1
+  return NaiveBayesClassifier('rating', title_counts, categories, targets, labels, version)
+
+def _train_price_band(training_set, version):
+  title_counts, categories, _, prices = training_set
+  prices = np.asarray(prices, dtype=np.float64)
+  edges = np.unique(np.quantile(prices, np.linspace(0, 1, PRICE_BANDS + 1))) if len(prices) else np.array([0.0, 0.0])
+  labels = [f'£{low:.2f}-£{high:.2f}' for low, high in zip(edges[:-1], edges[1:])] or ['£0.00-£0.00']
+  targets = np.clip(np.searchsorted(edges, prices, side='right') - 1, 0, len(labels) - 1)
+  return NaiveBayesClassifier('price_band', title_counts, categories, targets, labels, version)
+
+# Model registry: name -> training function (training set, version) -> model.
+PREDICTION_MODELS = {
+  'rating': _train_rating,
+  'price_band': _train_price_band
+}
+
+def get_prediction_model(conn, db_path, version, name):
+  """
+  Returns the prediction model 'name' of the database 'db_path'. The model is trained on the first call,
+  kept warm in the worker and retrained only when the dataset version changes.
+  The hashed titles are shared by every model of the same version.
+  """
+  def build_training_set():
+    rows = conn.execute('SELECT title, category, rating, price FROM books ORDER BY id').fetchall()
+    titles, categories, ratings, prices = zip(*rows) if rows else ((),) * 4
+    return hash_title_ngrams(list(titles), PREDICTION_HASH_FEATURES), list(categories), ratings, prices
+
+  def build():
+    training_set = _cache.get(db_path, version, 'prediction_training_set', build_training_set)
+    return PREDICTION_MODELS[name](training_set, version)
+  return _cache.get(db_path, version, ('model', name), build)
+
+class _PendingPrediction:
+  __slots__ = ('model', 'title', 'category', 'result', 'error', 'done')
+
+  def __init__(self, model, title, category):
+    self.model = model
+    self.title = title
+    self.category = category
+    self.result = None
+    self.error = None
+    self.done = threading.Event()
+
+class MicroBatcher:
+  """
+  Groups concurrent predictions into micro-batches: the first pending prediction opens a window of
+  'window' seconds, and every prediction that arrives before it closes (up to 'max_batch') is
+  predicted in the same model call.
+  The batching thread is started lazily and again after a fork (gunicorn workers), since threads
+  do not survive the fork.
+  """
+  def __init__(self, window=0.002, max_batch=64):
+    self.window = window
+    self.max_batch = max_batch
+    self._pid = None
+    self._queue = None
+    self._lock = threading.Lock()
+
+  def predict(self, model, title, category, timeout=30):
+    """
+    Predicts one (title, category) pair with 'model', blocking until its batch is predicted.
+    """
+    self._ensure_started()
+    pending = _PendingPrediction(model, title, category)
+    self._queue.put(pending)
+    if not pending.done.wait(timeout):
+      raise TimeoutError('Prediction timed out.')
+    if pending.error is not None:
+      raise pending.error
+    return pending.result
+
+  def _ensure_started(self):
+    if self._pid == os.getpid():
+      return
+    with self._lock:
+      if self._pid != os.getpid():
+        self._queue = queue.SimpleQueue()
+        threading.Thread(target=self._run, args=(self._queue,), name='prediction_batcher', daemon=True).start()
+        self._pid = os.getpid()
+
+  def _collect(self, pending_queue):
+    batch = [pending_queue.get()]
+    deadline = time.perf_counter() + self.window
+    while len(batch) < self.max_batch:
+      remaining = deadline - time.perf_counter()
+      try:
+        batch.append(pending_queue.get(timeout=remaining) if remaining > 0 else pending_queue.get_nowait())
+      except queue.Empty:
+        break
+    return batch
+
+  def _run(self, pending_queue):
+    while True:
+      batch = self._collect(pending_queue)
+      metrics.PREDICTION_BATCH_SIZE.observe(len(batch))
+      # A batch may mix models (names, or versions during a reload).
+      by_model = {}
+      for pending in batch:
+        by_model.setdefault(id(pending.model), []).append(pending)
+      for group in by_model.values():
+        try:
+          results = group[0].model.predict([p.title for p in group], [p.category for p in group])
+          for pending, result in zip(group, results):
+            pending.result = result
+        except Exception as e:
+          for pending in group:
+            pending.error = e
+        for pending in group:
+          pending.done.set()
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+def get_batcher(window, max_batch):
+  """
+  Returns the micro-batcher of the given settings, shared by all the threads of the worker.
+  """
+  key = (window, max_batch)
+  if key not in _batchers:
+    with _batchers_lock:
+      _batchers.setdefault(key, MicroBatcher(window, max_batch))
+  return _batchers[key]
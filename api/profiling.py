@@ -0,0 +1,270 @@
+# This file implements the on-demand profiling of requests and of the scraping process.
+#
+# A request is profiled when it carries the header 'X-Profile: sampled' (stack sampling, saved as
+# collapsed stacks for flamegraph.pl/speedscope) or 'X-Profile: cprofile' (deterministic, saved as .pstats)
+# together with a valid JWT access token. The profile name is returned in the 'X-Profile-Id' header
+# and the files can be downloaded later from /api/v1/profiling/profiles.
+
+import os
+import re
+import sys
+import time
+import uuid
+import cProfile
+import functools
+import threading
+from collections import Counter
+from datetime import datetime
+from flask import Blueprint, current_app, jsonify, request, send_from_directory
+from flask_jwt_extended import decode_token, jwt_required
+
+from . import shards
+
+profiling_bp = Blueprint('profiling_bp', __name__, url_prefix='/api/v1/profiling')
+
+PROFILE_MODES = {'sampled': 'collapsed', 'cprofile': 'pstats'}
+
+class StackSampler:
+  """
+  Samples the stack of a thread at a fixed interval and counts identical stacks.
+  The result is written in the collapsed format ('root;caller;function count'), used by flamegraphs.
+  """
+  def __init__(self, thread_id, interval=0.001):
+    self.thread_id = thread_id
+    self.interval = interval
+    self.stacks = Counter()
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, name='profiling_sampler', daemon=True)
+
+  def start(self):
+    self._thread.start()
+
+  def stop(self):
+    self._stop.set()
+    self._thread.join()
+
+  def _run(self):
+    while not self._stop.is_set():
+      frame = sys._current_frames().get(self.thread_id)
+      if frame is not None:
+        self.stacks[self._collapse(frame)] += 1
+      time.sleep(self.interval)
+
+  @staticmethod
+  def _collapse(frame):
+    stack = []
+    while frame is not None:
+      code = frame.f_code
+      filename = '/'.join(code.co_filename.split(os.sep)[-2:])
+      stack.append(f'{code.co_name} ({filename}:{code.co_firstlineno})')
+      frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+  def save(self, path):
+    with open(path, 'w', encoding='utf-8') as file:
+      for stack, count in self.stacks.most_common():
+        file.write(f'{stack} {count}\n')
+
+def profile_call(function, mode, profile_dir, name, interval=0.001):
+  """
+  Runs 'function' in the current thread under the profiler 'mode' ('sampled' or 'cprofile'),
+  saves the profile as '<profile_dir>/<name>.<extension>' and returns the result of 'function'.
+  """
+  os.makedirs(profile_dir, exist_ok=True)
+  path = os.path.join(profile_dir, f'{name}.{PROFILE_MODES[mode]}')
+  if mode == 'cprofile':
+    profiler = cProfile.Profile()
+    try:
+      return profiler.runcall(function)
+    finally:
+      profiler.dump_stats(path)
+  sampler = StackSampler(threading.get_ident(), interval)
+  sampler.start()
+  try:
+    return function()
+  finally:
+    sampler.stop()
+    sampler.save(path)
+
+def new_profile_name(label):
+  """
+  Unique, filesystem safe, profile name.
+  """
+  label = re.sub(r'[^A-Za-z0-9]+', '-', label).strip('-')[:60] or 'root'
+  return f'{datetime.now():%Y%m%d-%H%M%S}-{label}-{uuid.uuid4().hex[:8]}'
+
+class ProfilingMiddleware:
+  """
+  WSGI middleware that profiles the whole request (Flask dispatch, extensions, view and serialization)
+  when the 'X-Profile' header and a valid JWT access token are present.
+  Other requests only pay for a header lookup.
+  """
+  def __init__(self, app):
+    self.app = app
+    self.wsgi_app = app.wsgi_app
+
+  def __call__(self, environ, start_response):
+    mode = environ.get('HTTP_X_PROFILE', '').lower()
+    if mode not in PROFILE_MODES or not self._is_authenticated(environ):
+      return self.wsgi_app(environ, start_response)
+    name = new_profile_name(f"{environ.get('REQUEST_METHOD')}-{environ.get('PATH_INFO')}")
+
+    def profiled_start_response(status, headers, exc_info=None):
+      return start_response(status, headers + [('X-Profile-Id', name)], exc_info)
+
+    return profile_call(
+      lambda: self.wsgi_app(environ, profiled_start_response),
+      mode,
+      self.app.config['PROFILE_DIR'],
+      name,
+      self.app.config['PROFILE_SAMPLE_INTERVAL']
+    )
+
+  def _is_authenticated(self, environ):
+    scheme, _, token = environ.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme != 'Bearer' or not token:
+      return False
+    try:
+      with self.app.app_context():
+        return decode_token(token).get('type') == 'access'
+    except Exception:
+      return False
+
+@profiling_bp.route('/profiles', methods=['GET'])
+@jwt_required()
+def list_profiles():
+  """
+  List the stored profiles.
+  (Requires a valid JWT token)
+  Returns the name, size and creation date of each profile, most recent first.
+  ---
+  tags:
+    - Profiling Endpoints
+  security:
+    - Bearer: []
+  responses:
+    200:
+      description: Returns the stored profiles.
+      schema:
+        type: object
+        properties:
+          profiles:
+            type: array
+            items:
+              type: object
+              properties:
+                name:
+                  type: string
+                size:
+                  type: integer
+                created_at:
+                  type: string
+  """
+  profile_dir = current_app.config['PROFILE_DIR']
+  profiles = []
+  if os.path.isdir(profile_dir):
+    for entry in os.scandir(profile_dir):
+      if entry.is_file():
+        profiles.append({
+          'name': entry.name,
+          'size': entry.stat().st_size,
+          'created_at': datetime.fromtimestamp(entry.stat().st_mtime).isoformat(timespec='seconds')
+        })
+  profiles.sort(key=lambda profile: profile['created_at'], reverse=True)
+  return jsonify({'profiles': profiles})
+
+@profiling_bp.route('/profiles/<path:name>', methods=['GET'])
+@jwt_required()
+def download_profile(name):
+  """
+  Download a stored profile.
+  (Requires a valid JWT token)
+  Returns the profile file (.collapsed or .pstats).
+  ---
+  tags:
+    - Profiling Endpoints
+  security:
+    - Bearer: []
+  parameters:
+    - name: name
+      in: path
+      required: true
+      schema:
+        type: string
+  responses:
+    200:
+      description: Returns the profile file.
+    404:
+      description: Profile Not Found.
+  """
+  return send_from_directory(os.path.abspath(current_app.config['PROFILE_DIR']), name, as_attachment=True)
+
+@profiling_bp.route('/scrape', methods=['POST'])
+@jwt_required()
+def profile_scrape():
+  """
+  Starts a profiled scraping process (of the primary shard) in the background.
+  (Requires a valid JWT token)
+  Returns the name of the profile, available when the scraping process finishes.
+  ---
+  tags:
+    - Profiling Endpoints
+  security:
+    - Bearer: []
+  parameters:
+    - name: mode
+      in: query
+      required: false
+      description: "'sampled' (collapsed stacks) or 'cprofile' (deterministic)."
+      schema:
+        type: string
+        example: sampled
+  responses:
+    202:
+      description: Returns a message indicating that the profiled scraping process has started.
+      schema:
+        type: object
+        properties:
+          status:
+            type: string
+          msg:
+            type: string
+          profile:
+            type: string
+    400:
+      description: Invalid profiling mode.
+    409:
+      description: Returns a message indicating that a scraping process is already running.
+  """
+  mode = request.args.get('mode', default='sampled', type=str)
+  if mode not in PROFILE_MODES:
+    return jsonify({'msg': f"Invalid mode. Available modes: {', '.join(PROFILE_MODES)}."}), 400
+  shard = shards.get_shards()[0]
+  active_threads = [t.name for t in threading.enumerate()]
+  if shards.scraping_thread_name(shard) in active_threads:
+    return jsonify({"msg": "A scraping process is already running."}), 409
+  # The scraper (requests/bs4) is only imported when a scraping process runs.
+  from scripts import scraper
+  name = new_profile_name('scraping')
+  profile_dir = current_app.config['PROFILE_DIR']
+  interval = current_app.config['PROFILE_SAMPLE_INTERVAL']
+  scrape_thread = threading.Thread(
+    target=profile_call,
+    args=(functools.partial(scraper.run_scraping_process, shard.base_url, shard.path), mode, profile_dir, name, interval),
+    name=shards.scraping_thread_name(shard)
+  )
+  scrape_thread.start()
+  return jsonify({
+    "status": "accepted",
+    "msg": "The profiled scraping process has started.",
+    "profile": f'{name}.{PROFILE_MODES[mode]}'
+  }), 202
+
+def init_app(app):
+  """
+  Wraps the application with the profiling middleware and registers the profiling endpoints.
+  """
+  app.config.setdefault('PROFILE_DIR', os.path.join('data', 'profiles'))
+  app.config.setdefault('PROFILE_SAMPLE_INTERVAL', 0.001)
+  app.wsgi_app = ProfilingMiddleware(app)
+  app.register_blueprint(profiling_bp)
@@ -1,49 +1,995 @@
 from . import db
+from . import shards
+import os
+import re
+import json
+import time
+import heapq
+import itertools
 import threading
-from scripts import scraper
 from flask_jwt_extended import jwt_required
-from flask import Blueprint, jsonify, request, render_template
+from flask import Blueprint, Response, current_app, jsonify, redirect, request, render_template, send_file, stream_with_context, url_for
 
 routes_bp = Blueprint('routes_bp', __name__, url_prefix='/api/v1')
 
+# Maximum number of IDs accepted by a single batch lookup.
+BATCH_MAX_IDS = 100
+# Maximum number of similar books returned per book.
+SIMILAR_MAX_K = 50
+# Maximum number of title hash buckets in the feature matrix.
+FEATURES_TEXT_HASH_SIZES = (0, 8, 16, 32, 64)
+# Maximum number of items predicted by a single /predict/batch request.
+PREDICT_BATCH_MAX_ITEMS = 1000
+# Maximum number of changes returned by a single /changes request.
+CHANGES_MAX_LIMIT = 1000
+# Seconds without events after which /changes/stream sends a keep-alive comment.
+CHANGES_KEEPALIVE = 10
+# Images are addressed by the SHA-256 of their content, so they never change: cached for a year.
+IMAGE_MAX_AGE = 365 * 24 * 3600
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+# Columns of the 'books' table that can be requested through the 'fields' parameter.
+BOOK_FIELDS = ('id', 'title', 'price', 'rating', 'availability', 'category', 'image_url')
+
+def _parse_fields():
+  """
+  Reads the 'fields' query parameter (?fields=id,title,price) and validates it against the 'books' columns.
+  Returns a tuple (fields, error) where 'fields' has every column when the parameter is not informed.
+  """
+  raw_fields = request.args.get('fields', type=str)
+  if not raw_fields:
+    return BOOK_FIELDS, None
+  fields = tuple(dict.fromkeys(field.strip().lower() for field in raw_fields.split(',') if field.strip()))
+  invalid_fields = [field for field in fields if field not in BOOK_FIELDS]
+  if not fields or invalid_fields:
+    return None, f"Invalid fields: {', '.join(invalid_fields) or raw_fields}. Available fields: {', '.join(BOOK_FIELDS)}."
+  return fields, None
+
+def _parse_book_ids():
+  """
+  Reads the book IDs of a batch request, from the JSON body ({"ids": [1, 2]})
+  or from the 'ids' query parameter (?ids=1,2).
+  Returns a tuple (ids, error) where 'ids' keeps the input order without duplicates.
+  """
+  if request.method == 'POST' and request.is_json:
+    body = request.get_json(silent=True)
+    if body is None:
+      return None, 'The request body is not a valid JSON.'
+    raw_ids = body.get('ids') if isinstance(body, dict) else None
+    if not isinstance(raw_ids, list):
+      return None, "The request body must be an object with an 'ids' list."
+  else:
+    raw_ids = [value.strip() for value in request.args.get('ids', '').split(',') if value.strip()]
+  if not raw_ids:
+    return None, 'At least one book ID must be informed.'
+  # bool is a subclass of int, and int() would also truncate floats and accept strings like '1_0' or ' 1'.
+  if not all(
+    (isinstance(value, int) and not isinstance(value, bool)) or (isinstance(value, str) and value.isascii() and value.isdigit())
+    for value in raw_ids
+  ):
+    return None, 'Book IDs must be integers.'
+  book_ids = list(dict.fromkeys(int(value) for value in raw_ids))
+  if len(book_ids) > BATCH_MAX_IDS:
+    return None, f'A maximum of {BATCH_MAX_IDS} IDs can be requested at once.'
+  return book_ids, None
+
+def _fetch_books_by_ids(conn, book_ids, fields):
+  """
+  Fetches many books with a single lookup on the primary key.
+  Returns a dictionary {id: book} where each book only has the requested 'fields'.
+  """
+  # The ID is always selected to index the result, even when it was not requested.
+  columns = fields if 'id' in fields else ('id',) + fields
+  placeholders = ', '.join('?' for _ in book_ids)
+  books = conn.execute(f"SELECT {', '.join(columns)} FROM books WHERE id IN ({placeholders})", list(book_ids)).fetchall()
+  return {book['id']: {field: book[field] for field in fields} for book in books}
+
+def _fetch_books_by_public_ids(book_ids, fields):
+  """
+  Fetches many books, from any shard, with a single primary key lookup per shard (in parallel).
+  Returns a dictionary {public id: book}.
+  """
+  local_ids = {}
+  for book_id in book_ids:
+    shard, local_id = shards.split_id(book_id)
+    if shard is not None:
+      local_ids.setdefault(shard, []).append(local_id)
+
+  def query(conn, shard):
+    return {
+      shards.global_id(shard, local_id): shards.to_public(shard, book)
+      for local_id, book in _fetch_books_by_ids(conn, local_ids[shard], fields).items()
+    }
+  books_by_id = {}
+  for result in shards.fan_out(query, list(local_ids)):
+    books_by_id.update(result)
+  return books_by_id
+
+def _query_books(sql, params, fields, order_by=None):
+  """
+  Runs a query of the 'books' table on every shard and merges the results.
+  'sql' has a '{columns}' placeholder. With 'order_by', every shard returns its books sorted by that column
+  and the sorted lists are merged with a k-way merge; otherwise they are concatenated in shard order.
+  """
+  columns = fields if order_by is None or order_by in fields else fields + (order_by,)
+
+  def query(conn, shard):
+    return [shards.to_public(shard, dict(book)) for book in conn.execute(sql.format(columns=', '.join(columns)), params).fetchall()]
+  results = shards.fan_out(query)
+  books = heapq.merge(*results, key=lambda book: book[order_by]) if order_by else itertools.chain.from_iterable(results)
+  if columns != fields:
+    return [{field: book[field] for field in fields} for book in books]
+  return list(books)
+
+def _similar_books(book_ids, k, fields):
+  """
+  Returns, for each ID in 'book_ids', the list of its 'k' most similar books (with their 'score'),
+  or None when the book does not exist.
+  """
+  from . import ml
+  conn = db.get_db()
+  index = ml.get_similar_books_index(conn, current_app.config['DATABASE_PATH'], db.get_dataset_version())
+  results = index.similar(book_ids, k)
+  similar_ids = {similar_id for result in results if result for similar_id, _ in result}
+  books_by_id = _fetch_books_by_ids(conn, similar_ids, fields) if similar_ids else {}
+  return [
+    None if result is None else [
+      {**books_by_id[similar_id], 'score': score} for similar_id, score in result if similar_id in books_by_id
+    ]
+    for result in results
+  ]
+
+def _feature_matrix():
+  """
+  Reads the 'text_hash' query parameter and returns the cached feature matrix for the current dataset version.
+  Returns a tuple (matrix, manifest, error).
+  """
+  from . import ml
+  text_hash = request.args.get('text_hash', default=0, type=int)
+  if text_hash not in FEATURES_TEXT_HASH_SIZES:
+    return None, None, f"'text_hash' must be one of {', '.join(map(str, FEATURES_TEXT_HASH_SIZES))}."
+  matrix, manifest = ml.get_feature_matrix(
+    db.get_db(), current_app.config['DATABASE_PATH'], db.get_dataset_version(), text_hash
+  )
+  return matrix, manifest, None
+
+def _npy_response(matrix):
+  """
+  Streams 'matrix' as a .npy file, with its size in 'Content-Length'.
+  """
+  from . import ml
+  response = Response(ml.npy_chunks(matrix), mimetype='application/octet-stream')
+  response.headers['Content-Length'] = str(ml.npy_size(matrix))
+  return response
+
+def _parse_prediction_item(item):
+  """
+  Validates a prediction input ({"title": "...", "category": "..."}).
+  Returns a tuple (title, category, error).
+  """
+  if not isinstance(item, dict):
+    return None, None, "Each item must be an object with a 'title' and an optional 'category'."
+  title, category = item.get('title'), item.get('category', '')
+  if not isinstance(title, str) or not title.strip():
+    return None, None, "'title' must be a non-empty string."
+  if not isinstance(category, str):
+    return None, None, "'category' must be a string."
+  return title, category, None
+
+def _prediction_model():
+  """
+  Reads the 'model' query parameter and returns the warm model of the current dataset version.
+  Returns a tuple (model, error).
+  """
+  from . import ml
+  name = request.args.get('model', default='rating', type=str)
+  if name not in ml.PREDICTION_MODELS:
+    return None, f"Invalid model. Available models: {', '.join(ml.PREDICTION_MODELS)}."
+  model = ml.get_prediction_model(db.get_db(), current_app.config['DATABASE_PATH'], db.get_dataset_version(), name)
+  return model, None
+
+def _batched_prediction(model, title, category):
+  """
+  Predicts one (title, category) pair in the micro-batch of the worker (grouped with concurrent predictions).
+  """
+  from . import ml
+  batcher = ml.get_batcher(current_app.config['PREDICT_BATCH_WINDOW'], current_app.config['PREDICT_MAX_BATCH'])
+  return batcher.predict(model, title, category)
+
+def _fetch_changes(conn, since, after=0, limit=CHANGES_MAX_LIMIT, until=None):
+  """
+  Returns the changes of the dataset versions after 'since' (up to 'until', when informed, and after
+  the change 'after', for pagination), in the order they were written by the scraper.
+  A negative 'limit' returns every change.
+  """
+  rows = conn.execute(
+    '''
+      SELECT id, version, book_id, operation, fields, book FROM book_changes
+      WHERE version > ? AND version <= ? AND id > ? ORDER BY id LIMIT ?
+    ''',
+    (since, until if until is not None else 2 ** 62, after, limit)
+  ).fetchall()
+  return [
+    {
+      'change_id': row['id'],
+      'version': row['version'],
+      'book_id': row['book_id'],
+      'operation': row['operation'],
+      'fields': json.loads(row['fields']) if row['fields'] else None,
+      'book': json.loads(row['book']) if row['book'] else None
+    }
+    for row in rows
+  ]
+
+def _changes_available(conn, since, version):
+  """
+  Tells if every change after 'since' is still in 'book_changes' (the scraper prunes the oldest versions).
+  """
+  if since >= version:
+    return True
+  oldest = conn.execute('SELECT MIN(version) FROM book_changes').fetchone()[0]
+  return oldest is not None and since >= oldest - 1
+
+_active_streams = 0
+_active_streams_lock = threading.Lock()
+
+def _acquire_stream(max_streams):
+  """
+  Reserves one of the 'max_streams' /changes/stream connections of this worker. Returns False when none is free.
+  """
+  global _active_streams
+  with _active_streams_lock:
+    if _active_streams >= max_streams:
+      return False
+    _active_streams += 1
+    return True
+
+def _release_stream():
+  global _active_streams
+  with _active_streams_lock:
+    _active_streams -= 1
+
+def _since_version():
+  """
+  Reads the last version known by the client, from the 'since' query parameter or,
+  on a reconnection of an EventSource, from the 'Last-Event-ID' header.
+  Raises ValueError when 'since' is not a non-negative integer.
+  """
+  return _version_arg('since', default=_last_event_id())
+
+def _last_event_id():
+  last_event_id = request.headers.get('Last-Event-ID', '')
+  return int(last_event_id) if last_event_id.isdigit() else 0
+
+def _version_arg(name, default=0):
+  """
+  Reads a non-negative integer query parameter (a dataset version or a change ID).
+  Raises ValueError when it is not one, instead of falling back to the default.
+  """
+  value = request.args.get(name)
+  if value is None:
+    return default
+  if not value.isdigit():
+    raise ValueError(f"'{name}' must be a non-negative integer.")
+  return int(value)
+
 @routes_bp.route('/', methods=['GET'])
 def index():
   return render_template('index.html')
 
-# Required Endpoints
-@routes_bp.route('/books', methods=['GET'])
-def get_all_books():
+# Required Endpoints
+@routes_bp.route('/books', methods=['GET'])
+def get_all_books():
+  """
+  List all books.
+  Raises: 
+    Raise an exception if there is an error fetching data from the database.
+  Returns:
+    Returns a list of all books in the database.
+  ---
+  tags:
+    - Required Endpoints
+  parameters:
+    - name: fields
+      in: query
+      required: false
+      description: "Comma separated list of fields to return. Example: id,title,price"
+      schema:
+        type: string
+  responses:
+    200:
+      description: List all books.
+      schema:
+        type: array
+        items:
+          type: object
+          properties:
+            id:
+              type: integer
+            Title:
+              type: string
+            Rating:
+              type: string
+            Price:
+              type: string
+            Image:
+              type: string
+            Category:
+              type: string
+            Availability:
+              type: string
+    400:
+      description: Invalid fields.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+    500:
+      description: Data not available or failed to load.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+  """
+  try:
+    fields, error = _parse_fields()
+    if error:
+      return jsonify({'msg': error}), 400
+    books_dict = _query_books('SELECT {columns} FROM books ORDER BY title', (), fields, order_by='title')
+    return jsonify(books_dict)
+  except Exception as e:
+    print(f"Error fetching all books: {e}")
+    return jsonify({'msg': 'Data not available or failed to load.'}), 500
+
+@routes_bp.route('/books/<int:book_id>', methods=['GET'])
+def get_book_by_id(book_id):
+  """
+  Get a book by ID.
+  Raises:
+    Raise an exception if there is an error fetching data from the database.
+  Returns:
+    Returns details of a book by ID.
+  ---
+  tags:
+    - Required Endpoints
+  parameters:
+    - name: book_id
+      in: path
+      required: true
+      schema:
+        type: integer
+        format: int64
+        example: 1
+    - name: fields
+      in: query
+      required: false
+      description: "Comma separated list of fields to return. Example: id,title,price"
+      schema:
+        type: string
+  responses:
+    200:
+      description: Returns details of a book by ID.
+      schema:
+        type: object
+        properties:
+          id:
+            type: integer
+          Title:
+            type: string
+          Rating:
+            type: string
+          Price:
+            type: string
+          Image:
+            type: string
+          Category:
+            type: string
+          Availability:
+            type: string
+    400:
+      description: Invalid fields.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+    404:
+      description: Book Not Found.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+    500:
+      description: Data not available or failed to load.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+  """
+  try:
+    fields, error = _parse_fields()
+    if error:
+      return jsonify({'msg': error}), 400
+    shard, local_id = shards.split_id(book_id)
+    if shard is None:
+      return jsonify({'msg': 'Book Not Found.'}), 404
+    books = shards.fan_out(
+      lambda conn, shard: conn.execute(f"SELECT {', '.join(fields)} FROM books WHERE id = ?", (local_id,)).fetchone(),
+      [shard]
+    )
+    if not books or books[0] is None:
+      return jsonify({'msg': 'Book Not Found.'}), 404
+    return jsonify(shards.to_public(shard, dict(books[0])))
+  except Exception as e:
+    print(f"Error fetching book by ID: {e}")
+    return jsonify({'msg': 'Data not available or failed to load.'}), 500
+
+@routes_bp.route('/books/batch', methods=['GET', 'POST'])
+def get_books_batch():
+  """
+  Get many books by ID in a single request.
+  Raises:
+    Raise an exception if there is an error fetching data from the database.
+  Returns:
+    Returns the books found, in the same order as the requested IDs, and the IDs that were not found.
+  ---
+  tags:
+    - Required Endpoints
+  parameters:
+    - name: ids
+      in: query
+      required: false
+      description: "Comma separated list of IDs (GET). Example: 1,2,3"
+      schema:
+        type: string
+    - name: body
+      in: body
+      required: false
+      description: "List of IDs (POST)."
+      schema:
+        type: object
+        properties:
+          ids:
+            type: array
+            items:
+              type: integer
+            example: [1, 2, 3]
+    - name: fields
+      in: query
+      required: false
+      description: "Comma separated list of fields to return. Example: id,title,price"
+      schema:
+        type: string
+  responses:
+    200:
+      description: Returns the books found and the missing IDs.
+      schema:
+        type: object
+        properties:
+          books:
+            type: array
+            items:
+              type: object
+              properties:
+                id:
+                  type: integer
+                Title:
+                  type: string
+                Rating:
+                  type: string
+                Price:
+                  type: string
+                Image:
+                  type: string
+                Category:
+                  type: string
+                Availability:
+                  type: string
+          missing:
+            type: array
+            items:
+              type: integer
+    400:
+      description: Invalid list of IDs or fields.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+    500:
+      description: Data not available or failed to load.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+  """
+  try:
+    book_ids, error = _parse_book_ids()
+    if error:
+      return jsonify({'msg': error}), 400
+    fields, error = _parse_fields()
+    if error:
+      return jsonify({'msg': error}), 400
+    # A single lookup on the primary key per shard, instead of one request per book.
+    books_by_id = _fetch_books_by_public_ids(book_ids, fields)
+    return jsonify({
+      'books': [books_by_id[book_id] for book_id in book_ids if book_id in books_by_id],
+      'missing': [book_id for book_id in book_ids if book_id not in books_by_id]
+    })
+  except Exception as e:
+    print(f"Error fetching books batch: {e}")
+    return jsonify({'msg': 'Data not available or failed to load.'}), 500
+
+@routes_bp.route('/books/<int:book_id>/similar', methods=['GET'])
+def get_similar_books(book_id):
+  """
+  Get the books most similar to a book.
+  Similarity combines the title (TF-IDF of character n-grams), category, rating and price.
+  Raises:
+    Raise an exception if there is an error fetching data from the database.
+  Returns:
+    Returns the 'k' most similar books, with their similarity score, most similar first.
+  ---
+  tags:
+    - Machine Learning Endpoints
+  parameters:
+    - name: book_id
+      in: path
+      required: true
+      schema:
+        type: integer
+        format: int64
+        example: 1
+    - name: k
+      in: query
+      required: false
+      description: "Number of similar books (1 to 50). Default: 10"
+      schema:
+        type: integer
+        example: 10
+    - name: fields
+      in: query
+      required: false
+      description: "Comma separated list of fields to return. Example: id,title,price"
+      schema:
+        type: string
+  responses:
+    200:
+      description: Returns the most similar books.
+      schema:
+        type: object
+        properties:
+          book_id:
+            type: integer
+          similar:
+            type: array
+            items:
+              type: object
+              properties:
+                id:
+                  type: integer
+                Title:
+                  type: string
+                Rating:
+                  type: string
+                Price:
+                  type: string
+                Image:
+                  type: string
+                Category:
+                  type: string
+                Availability:
+                  type: string
+                score:
+                  type: number
+    400:
+      description: Invalid 'k' or fields.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+    404:
+      description: Book Not Found.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+    500:
+      description: Data not available or failed to load.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+  """
+  try:
+    k = request.args.get('k', default=10, type=int)
+    if k < 1 or k > SIMILAR_MAX_K:
+      return jsonify({'msg': f"'k' must be between 1 and {SIMILAR_MAX_K}."}), 400
+    fields, error = _parse_fields()
+    if error:
+      return jsonify({'msg': error}), 400
+    similar = _similar_books([book_id], k, fields)[0]
+    if similar is None:
+      return jsonify({'msg': 'Book Not Found.'}), 404
+    return jsonify({'book_id': book_id, 'similar': similar})
+  except Exception as e:
+    print(f"Error fetching similar books: {e}")
+    return jsonify({'msg': 'Data not available or failed to load.'}), 500
+
+@routes_bp.route('/books/similar', methods=['GET', 'POST'])
+def get_similar_books_batch():
+  """
+  Get the books most similar to many books in a single request.
+  Raises:
+    Raise an exception if there is an error fetching data from the database.
+  Returns:
+    Returns the 'k' most similar books of each requested ID, in the same order, and the IDs that were not found.
+  ---
+  tags:
+    - Machine Learning Endpoints
+  parameters:
+    - name: ids
+      in: query
+      required: false
+      description: "Comma separated list of IDs (GET). Example: 1,2,3"
+      schema:
+        type: string
+    - name: body
+      in: body
+      required: false
+      description: "List of IDs (POST)."
+      schema:
+        type: object
+        properties:
+          ids:
+            type: array
+            items:
+              type: integer
+            example: [1, 2, 3]
+    - name: k
+      in: query
+      required: false
+      description: "Number of similar books per ID (1 to 50). Default: 10"
+      schema:
+        type: integer
+        example: 10
+    - name: fields
+      in: query
+      required: false
+      description: "Comma separated list of fields to return. Example: id,title,price"
+      schema:
+        type: string
+  responses:
+    200:
+      description: Returns the most similar books of each ID and the missing IDs.
+      schema:
+        type: object
+        properties:
+          results:
+            type: array
+            items:
+              type: object
+              properties:
+                book_id:
+                  type: integer
+                similar:
+                  type: array
+                  items:
+                    type: object
+          missing:
+            type: array
+            items:
+              type: integer
+    400:
+      description: Invalid list of IDs, 'k' or fields.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+    500:
+      description: Data not available or failed to load.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+  """
+  try:
+    book_ids, error = _parse_book_ids()
+    if error:
+      return jsonify({'msg': error}), 400
+    k = request.args.get('k', default=10, type=int)
+    if k < 1 or k > SIMILAR_MAX_K:
+      return jsonify({'msg': f"'k' must be between 1 and {SIMILAR_MAX_K}."}), 400
+    fields, error = _parse_fields()
+    if error:
+      return jsonify({'msg': error}), 400
+    results = _similar_books(book_ids, k, fields)
+    return jsonify({
+      'results': [
+        {'book_id': book_id, 'similar': similar} for book_id, similar in zip(book_ids, results) if similar is not None
+      ],
+      'missing': [book_id for book_id, similar in zip(book_ids, results) if similar is None]
+    })
+  except Exception as e:
+    print(f"Error fetching similar books batch: {e}")
+    return jsonify({'msg': 'Data not available or failed to load.'}), 500
+
+@routes_bp.route('/features', methods=['GET'])
+def get_feature_matrix():
+  """
+  Download the feature matrix of all books, for ML training pipelines.
+  The matrix is a NumPy structured array in the .npy format (np.load), streamed in chunks,
+  with one row per book (ordered by ID) and the columns described by /features/manifest.
+  Raises:
+    Raise an exception if there is an error fetching data from the database.
+  Returns:
+    Returns the .npy file.
+  ---
+  tags:
+    - Machine Learning Endpoints
+  produces:
+    - application/octet-stream
+  parameters:
+    - name: text_hash
+      in: query
+      required: false
+      description: "Number of buckets of the hashed title n-grams (0, 8, 16, 32 or 64). Default: 0 (no title features)"
+      schema:
+        type: integer
+        example: 16
+  responses:
+    200:
+      description: Returns the feature matrix (.npy).
+    304:
+      description: The matrix did not change (If-None-Match).
+    400:
+      description: Invalid 'text_hash'.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+    500:
+      description: Data not available or failed to load.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+  """
+  try:
+    matrix, manifest, error = _feature_matrix()
+    if error:
+      return jsonify({'msg': error}), 400
+    etag = f"{manifest['version']}-{request.args.get('text_hash', default=0, type=int)}-{manifest['rows']}"
+    if etag in request.if_none_match:
+      return Response(status=304, headers={'ETag': f'"{etag}"'})
+    response = _npy_response(matrix)
+    response.headers['Content-Disposition'] = f"attachment; filename=books-features-v{manifest['version']}.npy"
+    response.headers['X-Dataset-Version'] = str(manifest['version'])
+    response.set_etag(etag)
+    return response
+  except Exception as e:
+    print(f"Error building feature matrix: {e}")
+    return jsonify({'msg': 'Data not available or failed to load.'}), 500
+
+@routes_bp.route('/features/manifest', methods=['GET'])
+def get_feature_manifest():
+  """
+  Describe the columns of the feature matrix.
+  Raises:
+    Raise an exception if there is an error fetching data from the database.
+  Returns:
+    Returns the dataset version, number of rows, dtype, columns and category encoding of /features.
+  ---
+  tags:
+    - Machine Learning Endpoints
+  parameters:
+    - name: text_hash
+      in: query
+      required: false
+      description: "Number of buckets of the hashed title n-grams (0 to 64). Default: 0"
+      schema:
+        type: integer
+  responses:
+    200:
+      description: Returns the manifest of the feature matrix.
+      schema:
+        type: object
+        properties:
+          version:
+            type: integer
+          rows:
+            type: integer
+          format:
+            type: string
+          dtype:
+            type: array
+            items:
+              type: array
+          columns:
+            type: array
+            items:
+              type: object
+              properties:
+                name:
+                  type: string
+                dtype:
+                  type: string
+                shape:
+                  type: array
+                  items:
+                    type: integer
+                description:
+                  type: string
+          categories:
+            type: array
+            items:
+              type: string
+    400:
+      description: Invalid 'text_hash'.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+    500:
+      description: Data not available or failed to load.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+  """
+  try:
+    _, manifest, error = _feature_matrix()
+    if error:
+      return jsonify({'msg': error}), 400
+    return jsonify(manifest)
+  except Exception as e:
+    print(f"Error building feature manifest: {e}")
+    return jsonify({'msg': 'Data not available or failed to load.'}), 500
+
+@routes_bp.route('/predict', methods=['POST'])
+def predict():
+  """
+  Predict the rating or the price band of a book from its title and category.
+  Concurrent requests are grouped into micro-batches and predicted together.
+  Raises:
+    Raise an exception if there is an error fetching data from the database.
+  Returns:
+    Returns the predicted class and the probability of each class.
+  ---
+  tags:
+    - Machine Learning Endpoints
+  parameters:
+    - name: model
+      in: query
+      required: false
+      description: "'rating' or 'price_band'. Default: rating"
+      schema:
+        type: string
+        example: rating
+    - name: body
+      in: body
+      required: true
+      schema:
+        type: object
+        properties:
+          title:
+            type: string
+            example: A Light in the Attic
+          category:
+            type: string
+            example: Poetry
+  responses:
+    200:
+      description: Returns the prediction.
+      schema:
+        type: object
+        properties:
+          model:
+            type: string
+          version:
+            type: integer
+          prediction:
+            type: string
+          probabilities:
+            type: object
+    400:
+      description: Invalid model or input.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+    500:
+      description: Data not available or failed to load.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+  """
+  try:
+    title, category, error = _parse_prediction_item(request.get_json(silent=True))
+    if error:
+      return jsonify({'msg': error}), 400
+    model, error = _prediction_model()
+    if error:
+      return jsonify({'msg': error}), 400
+    result = _batched_prediction(model, title, category)
+    return jsonify({'model': model.name, 'version': model.version, **result})
+  except Exception as e:
+    print(f"Error predicting: {e}")
+    return jsonify({'msg': 'Data not available or failed to load.'}), 500
+
+@routes_bp.route('/predict/batch', methods=['POST'])
+def predict_batch():
   """
-  List all books.
-  Raises: 
+  Predict the rating or the price band of many books in a single request (one vectorized model call).
+  Raises:
     Raise an exception if there is an error fetching data from the database.
   Returns:
-    Returns a list of all books in the database.
+    Returns the predictions, in the same order as the items.
   ---
   tags:
-    - Required Endpoints
+    - Machine Learning Endpoints
+  parameters:
+    - name: model
+      in: query
+      required: false
+      description: "'rating' or 'price_band'. Default: rating"
+      schema:
+        type: string
+        example: price_band
+    - name: body
+      in: body
+      required: true
+      description: "Up to 1000 items."
+      schema:
+        type: object
+        properties:
+          items:
+            type: array
+            items:
+              type: object
+              properties:
+                title:
+                  type: string
+                category:
+                  type: string
+            example: [{"title": "A Light in the Attic", "category": "Poetry"}]
   responses:
     200:
-      description: List all books.
+      description: Returns the predictions.
       schema:
-        type: array
-        items:
-          type: object
-          properties:
-            id:
-              type: integer
-            Title:
-              type: string
-            Rating:
-              type: string
-            Price:
-              type: string
-            Image:
-              type: string
-            Category:
-              type: string
-            Availability:
-              type: string
+        type: object
+        properties:
+          model:
+            type: string
+          version:
+            type: integer
+          predictions:
+            type: array
+            items:
+              type: object
+    400:
+      description: Invalid model or items.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
     500:
       description: Data not available or failed to load.
       schema:
@@ -53,62 +999,334 @@ def get_all_books():
             type: string
   """
   try:
-    conn = db.get_db()
-    books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
-    books_dict = [dict(book) for book in books]
-    return jsonify(books_dict)
+    body = request.get_json(silent=True)
+    items = body.get('items') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+      return jsonify({'msg': "The request body must be an object with a non-empty 'items' list."}), 400
+    if len(items) > PREDICT_BATCH_MAX_ITEMS:
+      return jsonify({'msg': f'A maximum of {PREDICT_BATCH_MAX_ITEMS} items can be predicted at once.'}), 400
+    titles, categories = [], []
+    for item in items:
+      title, category, error = _parse_prediction_item(item)
+      if error:
+        return jsonify({'msg': error}), 400
+      titles.append(title)
+      categories.append(category)
+    model, error = _prediction_model()
+    if error:
+      return jsonify({'msg': error}), 400
+    return jsonify({'model': model.name, 'version': model.version, 'predictions': model.predict(titles, categories)})
   except Exception as e:
-    print(f"Error fetching all books: {e}")
+    print(f"Error predicting batch: {e}")
     return jsonify({'msg': 'Data not available or failed to load.'}), 500
 
-@routes_bp.route('/books/<int:book_id>', methods=['GET'])
-def get_book_by_id(book_id):
+@routes_bp.route('/changes', methods=['GET'])
+def get_changes():
   """
-  Get a book by ID.
+  Get the books inserted, updated or removed since a dataset version (pull variant of /changes/stream).
   Raises:
     Raise an exception if there is an error fetching data from the database.
   Returns:
-    Returns details of a book by ID.
+    Returns the current dataset version and the changes after 'since', in the order they were written.
+    When 'next' is not null, more changes are available with '&after=<next>'.
   ---
   tags:
-    - Required Endpoints
+    - Change Feed Endpoints
   parameters:
-    - name: book_id
-      in: path
-      required: true
+    - name: since
+      in: query
+      required: false
+      description: "Last dataset version known by the client. Default: 0 (every change)"
+      schema:
+        type: integer
+        example: 3
+    - name: after
+      in: query
+      required: false
+      description: "Pagination: 'next' of the previous response."
+      schema:
+        type: integer
+    - name: limit
+      in: query
+      required: false
+      description: "Maximum number of changes (1 to 1000). Default: 1000"
       schema:
         type: integer
-        format: int64
-        example: 1
   responses:
     200:
-      description: Returns details of a book by ID.
+      description: Returns the changes.
       schema:
         type: object
         properties:
-          id:
+          version:
             type: integer
-          Title:
-            type: string
-          Rating:
+          next:
+            type: integer
+          changes:
+            type: array
+            items:
+              type: object
+              properties:
+                change_id:
+                  type: integer
+                version:
+                  type: integer
+                book_id:
+                  type: integer
+                operation:
+                  type: string
+                  enum: [insert, update, delete]
+                fields:
+                  type: array
+                  items:
+                    type: string
+                book:
+                  type: object
+    400:
+      description: Invalid 'limit', 'since' or 'after'.
+      schema:
+        type: object
+        properties:
+          msg:
             type: string
-          Price:
+    410:
+      description: The changes after 'since' were pruned. Reload the catalogue (/books) and continue from 'version'.
+      schema:
+        type: object
+        properties:
+          msg:
             type: string
-          Image:
+          version:
+            type: integer
+    500:
+      description: Data not available or failed to load.
+      schema:
+        type: object
+        properties:
+          msg:
             type: string
-          Category:
+  """
+  try:
+    limit = request.args.get('limit', default=CHANGES_MAX_LIMIT, type=int)
+    if limit < 1 or limit > CHANGES_MAX_LIMIT:
+      return jsonify({'msg': f"'limit' must be between 1 and {CHANGES_MAX_LIMIT}."}), 400
+    try:
+      since = _since_version()
+      after = _version_arg('after')
+    except ValueError as e:
+      return jsonify({'msg': str(e)}), 400
+    conn = db.get_db()
+    version = db.get_dataset_version()
+    if not _changes_available(conn, since, version):
+      return jsonify({
+        'msg': 'The changes after this version are no longer available. Reload the catalogue from /books.',
+        'version': version
+      }), 410
+    # Up to the version returned, like /changes/stream: a newer write is read with the next 'since'.
+    changes = _fetch_changes(conn, since, after, limit, until=version)
+    return jsonify({
+      'version': version,
+      'changes': changes,
+      'next': changes[-1]['change_id'] if len(changes) == limit else None
+    })
+  except Exception as e:
+    print(f"Error fetching changes: {e}")
+    return jsonify({'msg': 'Data not available or failed to load.'}), 500
+
+@routes_bp.route('/changes/stream', methods=['GET'])
+def stream_changes():
+  """
+  Server-sent events with the books inserted, updated or removed by each scraping process.
+  Each event ('changes') has the id of its dataset version and the changes of that version.
+  When the changes after the client version were pruned, a 'reset' event tells it to reload the catalogue.
+  The connection is closed after a short time (CHANGES_STREAM_HOLD), so it does not hold a worker;
+  the EventSource reconnects by itself, sending the last version received in 'Last-Event-ID'.
+  Each worker serves at most CHANGES_MAX_STREAMS streams at a time; beyond that, poll /changes.
+  Returns:
+    Returns the text/event-stream.
+  ---
+  tags:
+    - Change Feed Endpoints
+  produces:
+    - text/event-stream
+  parameters:
+    - name: since
+      in: query
+      required: false
+      description: "Last dataset version known by the client. Default: 'Last-Event-ID' header, or the current version"
+      schema:
+        type: integer
+  responses:
+    200:
+      description: Stream of 'changes' and 'reset' events.
+    400:
+      description: Invalid 'since'.
+      schema:
+        type: object
+        properties:
+          msg:
             type: string
-          Availability:
+    503:
+      description: Every stream of the worker is in use. Poll /changes instead, or retry later.
+      schema:
+        type: object
+        properties:
+          msg:
             type: string
+  """
+  db_path = current_app.config['DATABASE_PATH']
+  hold = current_app.config['CHANGES_STREAM_HOLD']
+  poll_interval = current_app.config['CHANGES_POLL_INTERVAL']
+  # A new client starts at the current version: the catalogue itself comes from /books.
+  try:
+    since = _since_version() if 'since' in request.args or 'Last-Event-ID' in request.headers else None
+  except ValueError as e:
+    return jsonify({'msg': str(e)}), 400
+
+  def events():
+    conn = db.connect(db_path)
+    try:
+      version = db.get_dataset_version(conn) if since is None else since
+      if not _changes_available(conn, version, db.get_dataset_version(conn)):
+        # The client must reload the catalogue (/books), then it continues from the current version.
+        version = db.get_dataset_version(conn)
+        yield f"event: reset\ndata: {json.dumps({'version': version})}\n\n"
+      # The client reconnects 1 second after the stream is closed.
+      yield f'retry: 1000\nid: {version}\n\n'
+      deadline = last_sent = time.monotonic()
+      deadline += hold
+      while time.monotonic() < deadline:
+        current_version = db.get_dataset_version(conn)
+        if current_version > version:
+          # Every change of a version goes in the same event, so 'id' always marks a complete version.
+          changes = _fetch_changes(conn, version, limit=-1, until=current_version)
+          for change_version in sorted({change['version'] for change in changes}):
+            batch = [change for change in changes if change['version'] == change_version]
+            yield f"id: {change_version}\nevent: changes\ndata: {json.dumps({'version': change_version, 'changes': batch})}\n\n"
+          version, last_sent = current_version, time.monotonic()
+        elif time.monotonic() - last_sent >= CHANGES_KEEPALIVE:
+          # Comment line: keeps proxies from closing the idle connection.
+          yield ': keep-alive\n\n'
+          last_sent = time.monotonic()
+        time.sleep(min(poll_interval, max(deadline - time.monotonic(), 0)))
+    finally:
+      conn.close()
+
+  # Each stream holds a thread of the worker: the other routes always keep some.
+  if not _acquire_stream(current_app.config['CHANGES_MAX_STREAMS']):
+    response = jsonify({'msg': 'Too many change streams. Poll /changes instead, or retry later.'})
+    response.headers['Retry-After'] = str(max(1, int(hold)))
+    return response, 503
+  response = Response(
+    stream_with_context(events()),
+    mimetype='text/event-stream',
+    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+  )
+  response.call_on_close(_release_stream)
+  return response
+
+@routes_bp.route('/images/<sha256>', methods=['GET'])
+def get_image(sha256):
+  """
+  Get a book cover from the local image store.
+  Images are addressed by the SHA-256 of their content, so the response can be cached forever (immutable)
+  and conditional requests (If-None-Match) are answered with 304.
+  Raises:
+    Raise an exception if there is an error fetching data from the database.
+  Returns:
+    Returns the original image, or its JPEG thumbnail with '?size=thumb'.
+  ---
+  tags:
+    - Image Endpoints
+  produces:
+    - image/jpeg
+  parameters:
+    - name: sha256
+      in: path
+      required: true
+      schema:
+        type: string
+    - name: size
+      in: query
+      required: false
+      description: "'original' or 'thumb'. Default: original (also returned when there is no thumbnail)"
+      schema:
+        type: string
+        example: thumb
+  responses:
+    200:
+      description: Returns the image.
+    304:
+      description: The image was not modified (If-None-Match).
     404:
-      description: Book Not Found.
+      description: Image not found.
       schema:
         type: object
         properties:
           msg:
             type: string
-    500:
-      description: Data not available or failed to load.
+  """
+  try:
+    from scripts import images
+    if not SHA256_PATTERN.match(sha256):
+      return jsonify({'msg': 'Image not found.'}), 404
+    # The image store is shared by the shards: the image is found in any shard that downloaded it.
+    found = shards.fan_out(
+      lambda conn, shard: conn.execute(
+        'SELECT content_type, MAX(has_thumbnail) AS has_thumbnail FROM images WHERE sha256 = ?', (sha256,)
+      ).fetchone()
+    )
+    image = next((image for image in found if image is not None and image['content_type'] is not None), None)
+    if image is None:
+      return jsonify({'msg': 'Image not found.'}), 404
+    thumbnail = request.args.get('size', default='original', type=str) == 'thumb' and bool(image['has_thumbnail'])
+    path = os.path.abspath(images.image_path(current_app.config['IMAGE_DIR'], sha256, thumbnail))
+    if not os.path.exists(path):
+      return jsonify({'msg': 'Image not found.'}), 404
+    response = send_file(
+      path,
+      mimetype='image/jpeg' if thumbnail else image['content_type'],
+      etag=f"{sha256}-thumb" if thumbnail else sha256,
+      conditional=True,
+      max_age=IMAGE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+  except Exception as e:
+    print(f"Error fetching image: {e}")
+    return jsonify({'msg': 'Data not available or failed to load.'}), 500
+
+@routes_bp.route('/books/<int:book_id>/cover', methods=['GET'])
+def get_book_cover(book_id):
+  """
+  Get the cover of a book.
+  Redirects to the local copy (/images/<sha256>) when the cover was downloaded by the scraper,
+  or to the original 'image_url' otherwise.
+  Raises:
+    Raise an exception if there is an error fetching data from the database.
+  Returns:
+    Returns a redirect to the cover.
+  ---
+  tags:
+    - Image Endpoints
+  parameters:
+    - name: book_id
+      in: path
+      required: true
+      schema:
+        type: integer
+    - name: size
+      in: query
+      required: false
+      description: "'original' or 'thumb'. Default: original"
+      schema:
+        type: string
+  responses:
+    302:
+      description: Redirects to the cover.
+    404:
+      description: Book Not Found.
       schema:
         type: object
         properties:
@@ -116,13 +1334,31 @@ def get_book_by_id(book_id):
             type: string
   """
   try:
-    conn = db.get_db()
-    book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+    shard, local_id = shards.split_id(book_id)
+    if shard is None:
+      return jsonify({'msg': 'Book Not Found'}), 404
+    found = shards.fan_out(
+      lambda conn, shard: conn.execute(
+        'SELECT books.image_url, images.sha256 FROM books LEFT JOIN images ON images.url = books.image_url WHERE books.id = ?',
+        (local_id,)
+      ).fetchone(),
+      [shard]
+    )
+    book = found[0] if found else None
     if book is None:
-      return jsonify({'msg': 'Book Not Found.'}), 404
-    return jsonify(dict(book))
+      return jsonify({'msg': 'Book Not Found'}), 404
+    if book['sha256'] is None:
+      if not book['image_url']:
+        return jsonify({'msg': 'Image not found.'}), 404
+      response = redirect(book['image_url'])
+    else:
+      size = request.args.get('size', default='original', type=str)
+      response = redirect(url_for('routes_bp.get_image', sha256=book['sha256'], size='thumb' if size == 'thumb' else None))
+    # The cover of a book may change on the next scraping: only the images themselves are immutable.
+    response.cache_control.max_age = 300
+    return response
   except Exception as e:
-    print(f"Error fetching book by ID: {e}")
+    print(f"Error fetching book cover: {e}")
     return jsonify({'msg': 'Data not available or failed to load.'}), 500
 
 @routes_bp.route('/books/search', methods=['GET'])
@@ -132,7 +1368,7 @@ def search_books():
   Raises:
     Raise an exception if there is an error fetching data from the database.
   Returns:
-    Returns all books that match the search criteria.
+    Returns all books that match the search criteria, ordered by title.
   ---
   tags:
     - Required Endpoints
@@ -149,9 +1385,24 @@ def search_books():
       schema:
         type: string
       example: "Mystery"
+    - name: fields
+      in: query
+      required: false
+      description: "Comma separated list of fields to return. Example: id,title,price"
+      schema:
+        type: string
+    - name: facets
+      in: query
+      required: false
+      description: "If true, returns an object with the books and the facet counts of the search
+        (total, average price, categories, ratings and price buckets of 10 pounds). Default: false"
+      schema:
+        type: boolean
+        example: true
   responses:
     200:
-      description: Returns a list of books matching the search criteria.
+      description: Returns a list of books matching the search criteria
+        (or {"books", "facets"} when 'facets' is true).
       schema:
         type: array
         items:
@@ -171,6 +1422,13 @@ def search_books():
               type: string
             Availability:
               type: string
+    400:
+      description: Invalid fields.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
     503:
       description: Data not available or failed to load.
       schema:
@@ -180,20 +1438,40 @@ def search_books():
             type: string
   """ 
   try:
+    fields, error = _parse_fields()
+    if error:
+      return jsonify({'msg': error}), 400
     query_title = request.args.get('title', type=str)
     query_category = request.args.get('category', type=str)
-    query = 'SELECT * FROM books WHERE 1=1'
+    with_facets = request.args.get('facets', default='false', type=str).lower() in ('true', '1')
+    where = '1=1'
     params = []
     if query_title:
-      query += ' AND upper(title) LIKE ?'
+      where += ' AND upper(title) LIKE ?'
       params.append(f'%{query_title.upper()}%')
     if query_category:
-      query += ' AND upper(category) = ?'
+      where += ' AND upper(category) = ?'
       params.append(query_category.upper())
+    # The facets are counted from the IDs of the results, and the results of the shards are merged by title,
+    # so both are selected even when they were not requested.
+    columns = tuple(dict.fromkeys((('id',) if with_facets else ()) + ('title',) + fields))
+    query = f"SELECT {', '.join(columns)} FROM books WHERE {where} ORDER BY title"
     # print(f"Executing query: {query} with params: {params}")
-    conn = db.get_db()
-    books = conn.execute(query, params).fetchall()
-    books_dict = [dict(book) for book in books]
+    if with_facets:
+      from . import facets
+
+    def search_shard(conn, shard):
+      books = conn.execute(query, params).fetchall()
+      partial_counts = None
+      if with_facets:
+        index = facets.get_facet_index(conn, shard.path, db.get_dataset_version(conn))
+        partial_counts = index.partial_counts([book['id'] for book in books])
+      return [(book['title'], shards.to_public(shard, {field: book[field] for field in fields})) for book in books], partial_counts
+    results = shards.fan_out(search_shard)
+    # k-way merge of the sorted results of each shard, like the other routes that query every shard.
+    books_dict = [book for _, book in heapq.merge(*(books for books, _ in results), key=lambda item: item[0])]
+    if with_facets:
+      return jsonify({'books': books_dict, 'facets': facets.merge_counts([counts for _, counts in results])})
     return jsonify(books_dict)
   except Exception as e:
     print(f"Error fetching books: {e}")
@@ -229,9 +1507,11 @@ def get_all_categories():
             type: string
   """ 
   try:
-    conn = db.get_db()
-    categories = conn.execute('SELECT DISTINCT category FROM books ORDER BY category').fetchall()
-    categories_list =[row['category'] for row in categories]
+    results = shards.fan_out(
+      lambda conn, shard: [row['category'] for row in conn.execute('SELECT DISTINCT category FROM books ORDER BY category').fetchall()]
+    )
+    # k-way merge of the sorted lists of each shard, without the categories present in more than one shard.
+    categories_list = list(dict.fromkeys(heapq.merge(*results, key=lambda category: (category is not None, category or ''))))
     return jsonify({'categories': categories_list})
   except Exception as e:
     print(f"Error fetching categories: {e}")
@@ -281,27 +1561,35 @@ def get_stats_overview():
             type: string
   """
   try:
-    conn = db.get_db()
-    query = """
-              SELECT 
-                COUNT(id) as total_books, 
-                AVG(price) as average_price 
-                FROM books
-            """
-    geral_stats = conn.execute(query).fetchone()
-    query = """
-              SELECT 
-                rating, 
-                COUNT(id) as count 
-              FROM books 
-              GROUP BY rating 
-              ORDER BY rating
-            """
-    ratings_stats = conn.execute(query).fetchall()
-    ratings_distribution = {f"{row['rating']} estrela(s)": row['count'] for row in ratings_stats}
+    # Mergeable partial aggregates: each shard returns counts and sums, the average is computed after the merge.
+    def shard_stats(conn, shard):
+      query = """
+                SELECT 
+                  COUNT(id) as total_books, 
+                  SUM(price) as total_price 
+                  FROM books
+              """
+      geral_stats = conn.execute(query).fetchone()
+      query = """
+                SELECT 
+                  rating, 
+                  COUNT(id) as count 
+                FROM books 
+                GROUP BY rating 
+              """
+      return geral_stats['total_books'], geral_stats['total_price'] or 0, [tuple(row) for row in conn.execute(query).fetchall()]
+    total_books, total_price, ratings = 0, 0, {}
+    for shard_books, shard_price, shard_ratings in shards.fan_out(shard_stats):
+      total_books += shard_books
+      total_price += shard_price
+      for rating, count in shard_ratings:
+        ratings[rating] = ratings.get(rating, 0) + count
+    ratings_distribution = {
+      f"{rating} estrela(s)": ratings[rating] for rating in sorted(ratings, key=lambda rating: (rating is not None, rating or 0))
+    }
     response = {
-        "total_books": geral_stats['total_books'],
-        "average_price": f"£{round(geral_stats['average_price'], 2) if geral_stats['average_price'] else 0}",
+        "total_books": total_books,
+        "average_price": f"£{round(total_price / total_books, 2) if total_books else 0}",
         "ratings_distribution": ratings_distribution
     }        
     return jsonify(response), 200
@@ -342,22 +1630,27 @@ def get_stats_categories():
             type: string
   """
   try:
-    conn = db.get_db()
     query = """
               SELECT
                   category,
                   COUNT(id) as book_count,
-                  AVG(price) as average_price
+                  SUM(price) as total_price
               FROM books
               GROUP BY category
               ORDER BY category
             """
-    stats_rows = conn.execute(query).fetchall()
+    # Mergeable partial aggregates: counts and sums per shard, the average is computed after the merge.
+    totals = {}
+    for stats_rows in shards.fan_out(lambda conn, shard: [tuple(row) for row in conn.execute(query).fetchall()]):
+      for category, book_count, total_price in stats_rows:
+        category_totals = totals.setdefault(category, [0, 0])
+        category_totals[0] += book_count
+        category_totals[1] += total_price
     category_stats = {}
-    for row in stats_rows:
-        category_stats[row['category']] = {
-            "books": row['book_count'],
-            "average_price": f"£{round(row['average_price'], 2)}"
+    for category, (book_count, total_price) in totals.items():
+        category_stats[category] = {
+            "books": book_count,
+            "average_price": f"£{round(total_price / book_count, 2)}"
         }
     return jsonify(category_stats)
   except Exception as e:
@@ -375,6 +1668,13 @@ def get_top_rated_books():
   ---
   tags:
     - Optional Endpoints
+  parameters:
+    - name: fields
+      in: query
+      required: false
+      description: "Comma separated list of fields to return. Example: id,title,price"
+      schema:
+        type: string
   responses:
     200:
       description: Returns a list of books with a 5-star rating.
@@ -397,6 +1697,13 @@ def get_top_rated_books():
               type: string
             Availability:
               type: string
+    400:
+      description: Invalid fields.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
     503:
       description: Data not available or failed to load.
       schema:
@@ -406,15 +1713,16 @@ def get_top_rated_books():
             type: string
   """
   try:
-    conn = db.get_db()
+    fields, error = _parse_fields()
+    if error:
+      return jsonify({'msg': error}), 400
     query = """
-          SELECT *
+          SELECT {columns}
           FROM books
           WHERE rating = '5'
           ORDER BY title
         """
-    top_rated_books = conn.execute(query).fetchall()
-    top_rated_books_dict = [dict(book) for book in top_rated_books]
+    top_rated_books_dict = _query_books(query, (), fields, order_by='title')
     return jsonify(top_rated_books_dict) # OK
   except Exception as e:
       print(f"Error fetching top rated books: {e}")
@@ -429,6 +1737,13 @@ def get_books_by_price_range():
   ---
   tags:
     - Optional Endpoints
+  parameters:
+    - name: fields
+      in: query
+      required: false
+      description: "Comma separated list of fields to return. Example: id,title,price"
+      schema:
+        type: string
   responses:
     200:
       description: Returns a list of books within a specified price range.
@@ -473,15 +1788,16 @@ def get_books_by_price_range():
       return jsonify({"msg": "Preços mínimo e máximo não podem ser negativos."}), 400
     if min_price > max_price:
       return jsonify({"msg": "O preço mínimo não pode ser maior que o preço máximo."}), 400
-    conn = db.get_db()
+    fields, error = _parse_fields()
+    if error:
+      return jsonify({'msg': error}), 400
     query = """
-          SELECT *
+          SELECT {columns}
           FROM books
           WHERE price BETWEEN ? AND ?
           ORDER BY title
         """
-    books_in_range = conn.execute(query, (min_price, max_price)).fetchall()
-    books_list = [dict(book) for book in books_in_range]
+    books_list = _query_books(query, (min_price, max_price), fields, order_by='title')
     return jsonify(books_list) # OK
   except Exception as e:
     print(f"Error fetching price range: {e}")
@@ -494,6 +1810,7 @@ def trigger_scrape():
   """
   Starts the web scraping process in the background.
   (Requires a valid JWT token)
+  Each shard of the catalogue is scraped by its own thread, independently of the others.
   Returns a message indicating that the scraping process has started.
   If a scraping process is already running, it returns a message indicating that.
   ---
@@ -508,9 +1825,26 @@ def trigger_scrape():
       description: "O Refresh Token válido, precedido pelo esquema 'Bearer '. Exemplo: 'Bearer Bla bla...'"
       schema:
         type: string
+    - name: shard
+      in: query
+      required: false
+      description: "Name of the shard to scrape. Default: every shard"
+      schema:
+        type: string
   responses:
     202:
       description: Returns a message indicating that the scraping process has started.
+      schema:
+        type: object
+        properties:
+          msg:
+            type: string
+          shards:
+            type: array
+            items:
+              type: string
+    404:
+      description: Shard not found.
       schema:
         type: object
         properties:
@@ -526,12 +1860,30 @@ def trigger_scrape():
           msg:
             type: string
   """
-  # Verifica se já existe um processo de scraping rodando antes de iniciar outro
+  shard_name = request.args.get('shard', type=str)
+  if shard_name is None:
+    requested_shards = shards.get_shards()
+  else:
+    shard = shards.get_shard(shard_name)
+    if shard is None:
+      return jsonify({'msg': f"Shard '{shard_name}' not found."}), 404
+    requested_shards = [shard]
+  # Verifica se já existe um processo de scraping rodando (por shard) antes de iniciar outro
   active_threads = [t.name for t in threading.enumerate()]
-  if 'scraping_thread' in active_threads:
+  idle_shards = [shard for shard in requested_shards if shards.scraping_thread_name(shard) not in active_threads]
+  if not idle_shards:
     return jsonify({"msg": "A scraping process is already running."}), 409
-  # Cria uma thread para executar a função de scraping
-  scrape_thread = threading.Thread(target=scraper.run_scraping_process, name='scraping_thread')
-  # Inicia a execução da thread em segundo plano
-  scrape_thread.start()
-  return jsonify({"status": "accepted", "msg": "The scraping process has started."}), 202
+  # O scraper (requests/bs4) só é importado quando um scraping é executado
+  from scripts import scraper
+  for shard in idle_shards:
+    # Cria uma thread por shard para executar a função de scraping
+    scrape_thread = threading.Thread(
+      target=scraper.run_scraping_process, args=(shard.base_url, shard.path), name=shards.scraping_thread_name(shard)
+    )
+    # Inicia a execução da thread em segundo plano
+    scrape_thread.start()
+  return jsonify({
+    "status": "accepted",
+    "msg": "The scraping process has started.",
+    "shards": [shard.name for shard in idle_shards]
+  }), 202
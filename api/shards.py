@@ -0,0 +1,114 @@
+# This file implements the partitioned storage of the catalogue: one SQLite file per source (shard).
+#
+# Shard 0 is the primary database (DATABASE_PATH, scraped from SCRAPER_BASE_URL); other shards are
+# configured with DATABASE_SHARDS='name=path=base_url,...'. Every shard has its own 'books' table and
+# is scraped independently: SQLite locks a whole file, so a shard being written never blocks the others.
+#
+# The public ID of a book is (shard << 32) | local ID, so the books of shard 0 keep their IDs.
+# Queries over the whole catalogue run on every shard in parallel, each on its own connection
+# (sqlite3 releases the GIL while a query runs), and their results are merged by the caller.
+
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context
+
+from . import db
+
+SHARD_BITS = 32
+LOCAL_ID_MASK = (1 << SHARD_BITS) - 1
+PRIMARY_SHARD = 'default'
+
+Shard = namedtuple('Shard', ['index', 'name', 'path', 'base_url'])
+
+def parse_shards(primary_path, primary_base_url=None, spec=''):
+  """
+  Returns the list of shards: the primary database, then the shards of 'spec' ('name=path[=base_url],...').
+  """
+  shards = [Shard(0, PRIMARY_SHARD, primary_path, primary_base_url)]
+  for entry in filter(None, (entry.strip() for entry in spec.split(','))):
+    name, _, rest = entry.partition('=')
+    path, _, base_url = rest.partition('=')
+    if not name or not path:
+      raise ValueError(f"Invalid shard '{entry}'. Expected 'name=path' or 'name=path=base_url'.")
+    if name in (shard.name for shard in shards):
+      raise ValueError(f"Duplicated shard name '{name}'.")
+    shards.append(Shard(len(shards), name, path, base_url or None))
+  return shards
+
+def get_shards():
+  """
+  Shards of the current application.
+  """
+  return current_app.config['SHARDS']
+
+def get_shard(name):
+  """
+  Returns the shard called 'name', or None.
+  """
+  return next((shard for shard in get_shards() if shard.name == name), None)
+
+def global_id(shard, local_id):
+  """
+  Public ID of the book 'local_id' of 'shard'.
+  """
+  return (shard.index << SHARD_BITS) | local_id
+
+def split_id(book_id):
+  """
+  Returns the tuple (shard, local ID) of a public book ID, or (None, None) when its shard does not exist.
+  """
+  shards = get_shards()
+  index, local_id = book_id >> SHARD_BITS, book_id & LOCAL_ID_MASK
+  if book_id < 0 or index >= len(shards):
+    return None, None
+  return shards[index], local_id
+
+def to_public(shard, book):
+  """
+  Replaces the local 'id' of a book (dictionary) by its public ID.
+  """
+  if shard.index and 'id' in book:
+    book['id'] = global_id(shard, book['id'])
+  return book
+
+def scraping_thread_name(shard):
+  """
+  Name of the thread that scrapes 'shard' (one scraping process per shard at a time).
+  """
+  return 'scraping_thread' if shard.index == 0 else f'scraping_thread:{shard.name}'
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+  # Created lazily, and again after a fork (gunicorn workers), since the threads do not survive the fork.
+  global _executor, _executor_pid
+  if _executor_pid != os.getpid():
+    with _executor_lock:
+      if _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4), thread_name_prefix='shard_query')
+        _executor_pid = os.getpid()
+  return _executor
+
+def fan_out(query, shards=None):
+  """
+  Runs 'query(conn, shard)' on every shard (or on 'shards') and returns the results, in the order of the shards.
+  With a single shard the query runs in the current thread, on the connection of the request.
+  Shards other than the primary are skipped while their database does not exist (not scraped yet).
+  """
+  shards = get_shards() if shards is None else shards
+  shards = [shard for shard in shards if shard.index == 0 or os.path.exists(shard.path)]
+  if len(shards) == 1 and shards[0].index == 0 and has_app_context():
+    return [query(db.get_db(), shards[0])]
+
+  def run(shard):
+    conn = db.connect(shard.path)
+    try:
+      return query(conn, shard)
+    finally:
+      conn.close()
+
+  return list(_get_executor().map(run, shards))
@@ -0,0 +1,66 @@
+"""
+Compares the batch lookup endpoint (/books/batch) against one /books/<id> call per book.
+
+Usage:
+    python -m benchmarks.batch_lookup --books 1000 --ids 100 --rounds 20
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+from benchmarks import synthetic
+
+def build_app(db_path):
+    """
+    Builds the application with create_app(), pointing at 'db_path' and without the scrape on boot.
+    """
+    os.environ['DATABASE_PATH'] = db_path
+    os.environ['SCRAPE_ON_BOOT'] = 'false'
+    from api.app import create_app
+    return create_app()
+
+def timed(function, rounds):
+    """
+    Runs 'function' 'rounds' times and returns the duration of each run in milliseconds.
+    """
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=1000, help='Number of books in the database.')
+    parser.add_argument('--ids', type=int, default=100, help='Number of IDs looked up per round.')
+    parser.add_argument('--rounds', type=int, default=20, help='Number of measured rounds.')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'books.db')
+        synthetic.build_catalogue(db_path, args.books)
+        client = build_app(db_path).test_client()
+        book_ids = random.sample(range(1, args.books + 1), args.ids)
+
+        def single_calls():
+            for book_id in book_ids:
+                assert client.get(f'/api/v1/books/{book_id}').status_code == 200
+
+        def batch_call():
+            assert client.post('/api/v1/books/batch', json={'ids': book_ids}).status_code == 200
+
+        # Warm up both paths before measuring.
+        single_calls()
+        batch_call()
+        single = timed(single_calls, args.rounds)
+        batch = timed(batch_call, args.rounds)
+    print(f"{args.ids} IDs over {args.books} books, {args.rounds} rounds (in-process, no network round-trip):")
+    print(f"\t{args.ids} x GET /books/<id>: median {statistics.median(single):.2f} ms")
+    print(f"\t1 x POST /books/batch: median {statistics.median(batch):.2f} ms")
+    print(f"\tSpeedup: {statistics.median(single) / statistics.median(batch):.1f}x")
+
+if __name__ == '__main__':
+    main()
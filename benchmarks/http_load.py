@@ -0,0 +1,424 @@
+"""
+HTTP load test of every API route against synthetic catalogues.
+
+For each catalogue size the application is built with create_app() (SCRAPE_ON_BOOT=false) and served
+in a separate process (gunicorn with gunicorn.conf.py, as in production, or the threaded werkzeug server
+with --server werkzeug), then each route is driven by concurrent keep-alive clients for a fixed duration.
+Before each route is measured, every gunicorn worker serves it at least once (warm-up), so the per-worker
+indexes and models are built outside the measured window. The first books of the catalogue get local covers
+(the 'images' table and a temporary image store), for /images/<sha256> and /books/<id>/cover.
+Reports throughput and p50/p95/p99 latency per route and compares the results with a stored baseline.
+
+Usage:
+    python -m benchmarks.http_load --sizes 1k,100k,1m --duration 5 --concurrency 4
+    python -m benchmarks.http_load --duration 10 --save-baseline
+    python -m benchmarks.http_load --url http://127.0.0.1:8000 --sizes 1k   # e.g. a running gunicorn
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import sqlite3
+import logging
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import urllib.request
+import multiprocessing
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts import images
+from benchmarks import synthetic, toscrape_mirror
+
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+BASELINE_PATH = os.path.join(RESULTS_DIR, 'baseline.json')
+# Books of each catalogue with a local cover (shared by the COVER_VARIANTS covers of the offline mirror).
+COVERED_BOOKS = 1_000
+# CHANGES_STREAM_HOLD of the server: each /changes/stream request lasts this long (seconds).
+STREAM_HOLD = '1'
+# Maximum time spent warming up each route (seconds).
+WARM_UP_TIMEOUT = 600
+
+def build_scenarios(total_books, rng, covers=()):
+    """
+    Returns the scenarios of the load test: name -> function that returns (method, path, body).
+    Every route of api/routes.py is covered, plus the health check.
+    'covers' are the SHA-256 of the local covers (see prepare_covers()).
+    """
+    def random_ids(count):
+        return rng.sample(range(1, total_books + 1), min(count, total_books))
+
+    def random_title():
+        return ' '.join(rng.choices(synthetic.WORDS, k=rng.randint(2, 6)))
+
+    def prediction_item():
+        return {'title': random_title(), 'category': rng.choice(synthetic.CATEGORIES)}
+
+    def random_cover():
+        return rng.choice(covers) if covers else '0' * 64
+    return {
+        'index': lambda: ('GET', '/api/v1/', None),
+        'health': lambda: ('GET', '/api/v1/health', None),
+        'books': lambda: ('GET', '/api/v1/books', None),
+        'books_fields': lambda: ('GET', '/api/v1/books?fields=id,title,price', None),
+        'book_by_id': lambda: ('GET', f'/api/v1/books/{rng.randint(1, total_books)}', None),
+        'books_batch': lambda: ('POST', '/api/v1/books/batch', {'ids': random_ids(100)}),
+        'books_search': lambda: (
+            'GET', '/api/v1/books/search?' + urlencode({
+                'title': rng.choice(synthetic.WORDS),
+                'category': rng.choice(synthetic.CATEGORIES)
+            }), None
+        ),
+        # The first request of each worker builds the facet index.
+        'books_search_facets': lambda: (
+            'GET', '/api/v1/books/search?' + urlencode({
+                'title': rng.choice(synthetic.WORDS),
+                'facets': 'true'
+            }), None
+        ),
+        # The first request of each worker builds the similarity index.
+        'books_similar': lambda: ('GET', f'/api/v1/books/{rng.randint(1, total_books)}/similar?k=10', None),
+        'books_similar_batch': lambda: (
+            'GET', '/api/v1/books/similar?' + urlencode({'ids': ','.join(map(str, random_ids(10))), 'k': 10}), None
+        ),
+        # The first request of each worker builds the feature matrix.
+        'features': lambda: ('GET', '/api/v1/features', None),
+        'features_manifest': lambda: ('GET', '/api/v1/features/manifest', None),
+        # The first request of each worker trains the model.
+        'predict': lambda: ('POST', '/api/v1/predict', prediction_item()),
+        'predict_batch': lambda: ('POST', '/api/v1/predict/batch?model=price_band', {'items': [prediction_item() for _ in range(100)]}),
+        'changes': lambda: ('GET', '/api/v1/changes?since=0', None),
+        # Each stream is held for STREAM_HOLD seconds; beyond CHANGES_MAX_STREAMS per worker it is refused (503)
+        # and the client waits for its Retry-After.
+        'changes_stream': lambda: ('GET', '/api/v1/changes/stream?since=0', None),
+        'image': lambda: ('GET', f'/api/v1/images/{random_cover()}', None),
+        'image_thumbnail': lambda: ('GET', f'/api/v1/images/{random_cover()}?size=thumb', None),
+        # Redirects to the local copy for the first COVERED_BOOKS books, to the original URL otherwise.
+        'book_cover': lambda: ('GET', f'/api/v1/books/{rng.randint(1, total_books)}/cover', None),
+        'categories': lambda: ('GET', '/api/v1/categories', None),
+        'stats_overview': lambda: ('GET', '/api/v1/stats/overview', None),
+        'stats_categories': lambda: ('GET', '/api/v1/stats/categories', None),
+        'top_rated': lambda: ('GET', '/api/v1/books/top-rated', None),
+        'price_range': lambda: ('GET', '/api/v1/books/price-range?min=20&max=25', None),
+        # Without a token: measures the JWT rejection path without starting a real scrape.
+        'scraping_trigger_unauthorized': lambda: ('POST', '/api/v1/scraping/trigger', None)
+    }
+
+def prepare_covers(db_path, image_dir):
+    """
+    Stores the covers of the offline mirror in 'image_dir' and records them as the covers of the first
+    COVERED_BOOKS books of the catalogue (the 'images' table). Returns the SHA-256 of the covers.
+    """
+    stored, lock = {}, threading.Lock()
+    covers = [
+        images.store_image(image_dir, toscrape_mirror.render_cover(variant), stored, lock)[:2]
+        for variant in range(toscrape_mirror.COVER_VARIANTS)
+    ]
+    conn = sqlite3.connect(db_path)
+    urls = [row[0] for row in conn.execute('SELECT image_url FROM books ORDER BY id LIMIT ?', (COVERED_BOOKS,))]
+    conn.executemany(
+        'INSERT OR REPLACE INTO images (url, sha256, content_type, size, has_thumbnail) VALUES (?, ?, ?, ?, ?)',
+        [
+            (url, sha256, 'image/bmp', os.path.getsize(images.image_path(image_dir, sha256)), has_thumbnail)
+            for url, (sha256, has_thumbnail) in zip(urls, covers * (len(urls) // len(covers) + 1))
+        ]
+    )
+    conn.commit()
+    conn.close()
+    return [sha256 for sha256, _ in covers]
+
+def server_env(db_path, image_dir):
+    """
+    Environment of the server process.
+    """
+    env = dict(os.environ, DATABASE_PATH=db_path, IMAGE_DIR=image_dir, SCRAPE_ON_BOOT='false', CHANGES_STREAM_HOLD=STREAM_HOLD)
+    env.setdefault('JWT_SECRET_KEY', 'benchmark-secret')
+    return env
+
+def serve(env, port_queue):
+    """
+    Target of the server process: builds the app with create_app() and serves it on a free port.
+    """
+    os.environ.update(env)
+    from werkzeug.serving import make_server
+    from api.app import create_app
+    # The access log of every request would distort the measurements.
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+def start_gunicorn(env, access_log, timeout=120):
+    """
+    Starts gunicorn with the production configuration (gunicorn.conf.py) and returns (process, base_url).
+    The access log only records the PID of the worker that served each request (see warm_up()).
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning', '--access-logfile', access_log, '--access-logformat', '%(p)s',
+         'api.app:create_app()'],
+        env=env, stdout=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(f'{base_url}/api/v1/health', timeout=5).read()
+            return process, base_url
+        except OSError:
+            if process.poll() is not None or time.perf_counter() > deadline:
+                process.terminate()
+                raise RuntimeError('gunicorn did not start.')
+            time.sleep(0.05)
+
+def start_server(env, access_log, server='gunicorn'):
+    """
+    Starts the server process and returns (process, base_url).
+    """
+    if server == 'gunicorn':
+        return start_gunicorn(env, access_log)
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(env, port_queue), daemon=True)
+    process.start()
+    port = port_queue.get(timeout=120)
+    return process, f'http://127.0.0.1:{port}'
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def send(conn, request_factory):
+    """
+    Sends a request built by 'request_factory' on 'conn' and reads the response.
+    Returns a tuple (ok, retry_after): 'ok' is False on a server error or a connection error, and 'retry_after'
+    is the 'Retry-After' of a 503 (every /changes/stream slot of the worker in use, as designed), or None.
+    """
+    method, path, body = request_factory()
+    headers = {}
+    if body is not None:
+        body = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    try:
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        retry_after = response.getheader('Retry-After') if response.status == 503 else None
+        if retry_after is not None:
+            return True, float(retry_after)
+        return response.status < 500, None
+    except (OSError, http.client.HTTPException):
+        conn.close()
+        return False, None
+
+def served_pids(access_log, offset):
+    """
+    PIDs of the gunicorn workers that logged a request after the byte 'offset' of the access log.
+    """
+    with open(access_log, encoding='utf-8') as file:
+        file.seek(offset)
+        return {int(line.strip().strip('<>')) for line in file if line.strip()}
+
+def worker_pids(process):
+    """
+    PIDs of the gunicorn workers (children of the master 'process').
+    """
+    output = subprocess.run(['pgrep', '-P', str(process.pid)], capture_output=True, text=True).stdout
+    return {int(pid) for pid in output.split()}
+
+def warm_up(base_url, request_factory, concurrency, process=None, access_log=None):
+    """
+    Sends requests built by 'request_factory', one per connection, until every gunicorn worker has served
+    one (read from the access log), so the caches and indexes built on the first request of each worker
+    are not measured. Without a gunicorn process (werkzeug or --url), sends one request per client.
+    """
+    url = urlsplit(base_url)
+
+    def request(_):
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=WARM_UP_TIMEOUT)
+        send(conn, request_factory)
+        conn.close()
+
+    if not isinstance(process, subprocess.Popen):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(request, range(concurrency)))
+        return
+    offset = os.path.getsize(access_log)
+    deadline = time.perf_counter() + WARM_UP_TIMEOUT
+    pids = worker_pids(process)
+    # Concurrent connections: a worker busy building an index leaves the next ones to the others.
+    with ThreadPoolExecutor(max_workers=len(pids)) as executor:
+        while not pids <= served_pids(access_log, offset):
+            if time.perf_counter() > deadline:
+                print(f"	Warm-up did not reach every worker in {WARM_UP_TIMEOUT}s.")
+                return
+            list(executor.map(request, range(len(pids))))
+
+def drive(base_url, request_factory, duration, concurrency):
+    """
+    Sends requests built by 'request_factory' from 'concurrency' threads during 'duration' seconds.
+    Returns the route statistics: requests, errors, throughput and latency percentiles (ms).
+    """
+    url = urlsplit(base_url)
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=600)
+        latencies, errors = [], 0
+        # At least one request per worker, even if a single request is longer than the duration.
+        while not latencies or time.perf_counter() < deadline:
+            start = time.perf_counter()
+            ok, retry_after = send(conn, request_factory)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors += 1
+            if retry_after is not None:
+                # Like an EventSource, retries only after the time advised by the server.
+                time.sleep(min(retry_after, max(deadline - time.perf_counter(), 0)))
+        conn.close()
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(lambda _: worker(), range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for worker_latencies, _ in outcomes for latency in worker_latencies)
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in outcomes),
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3)
+    }
+
+def run_size(size_name, args):
+    """
+    Runs every scenario against the catalogue 'size_name' and returns {scenario: statistics}.
+    """
+    total_books = synthetic.SIZES[size_name]
+    process, access_log, covers = None, None, ()
+    work_dir = tempfile.mkdtemp(prefix='http-load-')
+    try:
+        if args.url:
+            base_url = args.url
+        else:
+            db_path = synthetic.ensure_catalogue(size_name)
+            image_dir = os.path.join(work_dir, 'images')
+            covers = prepare_covers(db_path, image_dir)
+            access_log = os.path.join(work_dir, 'access.log')
+            process, base_url = start_server(server_env(db_path, image_dir), access_log, args.server)
+        scenarios = build_scenarios(total_books, random.Random(args.seed), covers)
+        selected = args.routes.split(',') if args.routes else scenarios
+        results = {}
+        for name in selected:
+            warm_up(base_url, scenarios[name], args.concurrency, process, access_log)
+            results[name] = drive(base_url, scenarios[name], args.duration, args.concurrency)
+            stats = results[name]
+            print(f"\t{size_name:>5} {name:<30} {stats['throughput_rps']:>10.1f} req/s   "
+                  f"p50 {stats['p50_ms']:>9.2f} ms   p95 {stats['p95_ms']:>9.2f} ms   "
+                  f"p99 {stats['p99_ms']:>9.2f} ms   errors {stats['errors']}")
+        return results
+    finally:
+        if process is not None:
+            process.terminate()
+            if isinstance(process, subprocess.Popen):
+                process.wait()
+            else:
+                process.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def compare(results, baseline, threshold):
+    """
+    Compares the results with the baseline and returns a list of regressions (messages).
+    A route regresses when its throughput drops, or its p95 latency grows, more than 'threshold'.
+    """
+    regressions = []
+    for size_name, routes in results.items():
+        for name, stats in routes.items():
+            reference = baseline.get('results', {}).get(size_name, {}).get(name)
+            if reference is None:
+                print(f"\tNo baseline for {size_name} {name}: run with --save-baseline to record it.")
+                continue
+            if stats['throughput_rps'] < reference['throughput_rps'] * (1 - threshold):
+                regressions.append(
+                    f"{size_name} {name}: throughput {stats['throughput_rps']} req/s < baseline {reference['throughput_rps']} req/s"
+                )
+            if stats['p95_ms'] > reference['p95_ms'] * (1 + threshold):
+                regressions.append(f"{size_name} {name}: p95 {stats['p95_ms']} ms > baseline {reference['p95_ms']} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(synthetic.SIZES), help='Comma separated catalogue sizes.')
+    parser.add_argument('--routes', default=None, help='Comma separated scenarios (default: all).')
+    parser.add_argument('--duration', type=float, default=5, help='Seconds spent on each route.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients per route.')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed of the generated requests.')
+    parser.add_argument('--url', default=None, help='Benchmark an already running server instead of starting one.')
+    parser.add_argument('--server', choices=('gunicorn', 'werkzeug'), default='gunicorn', help='Server started for each size.')
+    parser.add_argument('--output', default=None, help='File where the results are stored (JSON).')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline used to detect regressions.')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed regression (0.2 = 20%%).')
+    args = parser.parse_args()
+    unknown_sizes = [size_name for size_name in args.sizes.split(',') if size_name not in synthetic.SIZES]
+    if unknown_sizes:
+        parser.error(f"unknown sizes: {', '.join(unknown_sizes)} (available: {', '.join(synthetic.SIZES)})")
+    if args.routes:
+        scenarios = build_scenarios(1, random.Random(args.seed))
+        unknown_routes = [name for name in args.routes.split(',') if name not in scenarios]
+        if unknown_routes:
+            parser.error(f"unknown routes: {', '.join(unknown_routes)} (available: {', '.join(scenarios)})")
+
+    print("*************************************************************************************************")
+    print(f"Load test: {args.concurrency} clients, {args.duration}s per route ({args.url or args.server})")
+    results = {size_name: run_size(size_name, args) for size_name in args.sizes.split(',')}
+    report = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'duration': args.duration,
+            'concurrency': args.concurrency,
+            'server': args.url or ('gunicorn (gunicorn.conf.py)' if args.server == 'gunicorn' else 'werkzeug (threaded)')
+        },
+        'results': results
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = BASELINE_PATH if args.save_baseline else args.output
+    if output is None:
+        output = os.path.join(RESULTS_DIR, f"run-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results stored at: {output}")
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, encoding='utf-8') as file:
+        regressions = compare(results, json.load(file), args.threshold)
+    if regressions:
+        print(f"Regressions beyond {args.threshold:.0%} of the baseline:")
+        for regression in regressions:
+            print(f"\t{regression}")
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%} of the baseline.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
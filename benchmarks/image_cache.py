@@ -0,0 +1,101 @@
+"""
+Measures the local image store (scripts/images.py) against the offline mirror (benchmarks/toscrape_mirror.py):
+- download throughput of the covers for each number of concurrent workers, and the de-duplication;
+- latency of serving a cover from the local store (/api/v1/images/<sha256>) versus fetching it from the origin.
+
+Usage:
+    python -m benchmarks.image_cache --books 500 --latency 20 --jitter 5 --workers 1,8,32 --requests 500
+"""
+import os
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import multiprocessing
+
+from scripts import images, scraper
+from benchmarks import toscrape_mirror
+from benchmarks.http_load import percentile
+from benchmarks.scraper_throughput import serve
+
+def build_database(db_path, base_url, total_books, seed):
+    """
+    Creates a database with the books of the mirror, pointing at its covers.
+    """
+    scraper.setup_database(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT INTO books (title, price, rating, availability, category, image_url) VALUES (?, ?, ?, ?, ?, ?)',
+        [
+            (book['title'], book['price'], 1, str(book['availability']), book['category'], base_url + book['image'])
+            for book in toscrape_mirror.build_catalogue(total_books, seed)
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=500, help='Catalogue size of the mirror.')
+    parser.add_argument('--latency', type=float, default=20, help='Latency of the mirror responses, in ms.')
+    parser.add_argument('--jitter', type=float, default=5, help='Random variation of the latency, in ms.')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of responses with HTTP 503.')
+    parser.add_argument('--workers', default='1,8,32', help='Comma separated numbers of download workers.')
+    parser.add_argument('--requests', type=int, default=500, help='Cover requests measured on each path.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    counter = multiprocessing.Value('i', 0)
+    port_queue = multiprocessing.Queue()
+    mirror = multiprocessing.Process(target=serve, args=(args, counter, port_queue), daemon=True)
+    mirror.start()
+    work_dir = tempfile.mkdtemp(prefix='image-cache-')
+    try:
+        base_url = f'http://127.0.0.1:{port_queue.get(timeout=60)}/'
+        print("*************************************************************************************************")
+        print(f"Covers of {args.books} books (latency {args.latency} ms, jitter {args.jitter} ms, "
+              f"{toscrape_mirror.COVER_VARIANTS} distinct covers):")
+        for workers in (int(value) for value in args.workers.split(',')):
+            db_path = os.path.join(work_dir, f'books-{workers}.db')
+            image_dir = os.path.join(work_dir, f'images-{workers}')
+            build_database(db_path, base_url, args.books, args.seed)
+            start = time.perf_counter()
+            summary = images.download_images(db_path, scraper.fetch_page, image_dir, workers)
+            elapsed = time.perf_counter() - start
+            print(f"\t{workers:>3} workers: {summary['downloaded'] / elapsed:>7.1f} images/s   "
+                  f"{summary['new']} stored of {summary['downloaded']} downloaded, {summary['failed']} failed")
+
+        os.environ.update(DATABASE_PATH=db_path, IMAGE_DIR=image_dir, SCRAPE_ON_BOOT='false')
+        os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-secret')
+        from api.app import create_app
+        client = create_app().test_client()
+        conn = sqlite3.connect(db_path)
+        covers = conn.execute('SELECT images.url, images.sha256 FROM images').fetchall()
+        conn.close()
+        for name, size in (('local original', 'original'), ('local thumbnail', 'thumb')):
+            latencies = []
+            for _ in range(args.requests):
+                _, sha256 = rng.choice(covers)
+                start = time.perf_counter()
+                client.get(f'/api/v1/images/{sha256}?size={size}').get_data()
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            print(f"\t{name:<16}: p50 {percentile(latencies, 50):.2f} ms   p99 {percentile(latencies, 99):.2f} ms")
+        latencies = []
+        for _ in range(min(args.requests, 200)):
+            url, _ = rng.choice(covers)
+            start = time.perf_counter()
+            scraper.fetch_page(url, 'image')
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        print(f"\t{'origin':<16}: p50 {percentile(latencies, 50):.2f} ms   p99 {percentile(latencies, 99):.2f} ms")
+    finally:
+        mirror.terminate()
+        mirror.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Measures the prediction models of api/ml.py on a synthetic catalogue:
+- bulk prediction (/predict/batch path): throughput and latency per batch size;
+- micro-batched single predictions (/predict path): concurrent clients sending one prediction at a time,
+  for each batch window and maximum batch size, reporting throughput, latency and the mean batch size.
+
+Usage:
+    python -m benchmarks.predict_throughput --size 100k --model rating --clients 32 --windows 0,0.001,0.002,0.005
+"""
+import time
+import random
+import sqlite3
+import argparse
+import threading
+
+from api import ml
+from benchmarks import synthetic
+from benchmarks.http_load import percentile
+
+class CountingModel:
+    """
+    Wraps a model to count the number of calls and the number of predictions.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+        self.predictions = 0
+
+    def predict(self, titles, categories):
+        self.calls += 1
+        self.predictions += len(titles)
+        return self.model.predict(titles, categories)
+
+def run_clients(batcher, model, inputs, clients, requests_per_client):
+    """
+    Runs 'clients' threads, each sending 'requests_per_client' predictions one at a time.
+    Returns (wall time, sorted latencies in ms).
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def client(offset):
+        own = []
+        for i in range(requests_per_client):
+            title, category = inputs[(offset * requests_per_client + i) % len(inputs)]
+            start = time.perf_counter()
+            batcher.predict(model, title, category)
+            own.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sorted(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', default='100k', choices=synthetic.SIZES, help='Catalogue size used for training.')
+    parser.add_argument('--model', default='rating', choices=ml.PREDICTION_MODELS)
+    parser.add_argument('--batch-sizes', default='1,8,32,128,512', help='Comma separated bulk batch sizes.')
+    parser.add_argument('--windows', default='0,0.001,0.002,0.005', help='Comma separated batch windows, in seconds.')
+    parser.add_argument('--max-batches', default='16,64', help='Comma separated maximum micro-batch sizes.')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent clients of the micro-batcher.')
+    parser.add_argument('--requests', type=int, default=50, help='Predictions sent by each client.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    db_path = synthetic.ensure_catalogue(args.size)
+    conn = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    model = ml.get_prediction_model(conn, db_path, 0, args.model)
+    trained = time.perf_counter() - start
+    inputs = conn.execute('SELECT title, category FROM books ORDER BY RANDOM() LIMIT 5000').fetchall()
+    conn.close()
+    rng.shuffle(inputs)
+
+    print("*************************************************************************************************")
+    print(f"Model '{args.model}' trained on {args.size} books in {trained:.2f} s")
+    print("Bulk prediction (/predict/batch):")
+    for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+        latencies = []
+        predictions = 0
+        bench_start = time.perf_counter()
+        while time.perf_counter() - bench_start < 1 or len(latencies) < 5:
+            batch = [inputs[rng.randrange(len(inputs))] for _ in range(batch_size)]
+            call_start = time.perf_counter()
+            model.predict([title for title, _ in batch], [category for _, category in batch])
+            latencies.append((time.perf_counter() - call_start) * 1000)
+            predictions += batch_size
+        elapsed = time.perf_counter() - bench_start
+        latencies.sort()
+        print(f"\tbatch {batch_size:>4}: {predictions / elapsed:>9.0f} predictions/s   "
+              f"p50 {percentile(latencies, 50):.2f} ms   p95 {percentile(latencies, 95):.2f} ms")
+
+    print(f"Micro-batched single predictions (/predict), {args.clients} concurrent clients:")
+    for max_batch in (int(size) for size in args.max_batches.split(',')):
+        for window in (float(value) for value in args.windows.split(',')):
+            counting = CountingModel(model)
+            batcher = ml.MicroBatcher(window, max_batch)
+            wall, latencies = run_clients(batcher, counting, inputs, args.clients, args.requests)
+            print(f"\tmax batch {max_batch:>3}, window {window * 1000:>4.1f} ms: {len(latencies) / wall:>7.0f} predictions/s   "
+                  f"p50 {percentile(latencies, 50):.2f} ms   p95 {percentile(latencies, 95):.2f} ms   "
+                  f"p99 {percentile(latencies, 99):.2f} ms   mean batch {counting.predictions / max(counting.calls, 1):.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Measures the throughput of scripts/scraper.py on a full crawl of the offline mirror (benchmarks/toscrape_mirror.py).
+
+The mirror runs in a separate process, so the CPU time and memory reported belong to the crawler only.
+Reports pages/sec, CPU time per page and peak memory.
+
+Usage:
+    python -m benchmarks.scraper_throughput --books 1000 --latency 20 --jitter 5 --error-rate 0
+"""
+import time
+import resource
+import argparse
+import tracemalloc
+import multiprocessing
+
+from scripts import scraper
+from benchmarks import toscrape_mirror
+
+def serve(args, counter, port_queue):
+    """
+    Target of the mirror process.
+    """
+    server = toscrape_mirror.make_server(
+        '127.0.0.1', 0, args.books, args.latency, args.jitter, args.error_rate, args.seed, counter
+    )
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=1000, help='Catalogue size of the mirror.')
+    parser.add_argument('--latency', type=float, default=0, help='Latency of the mirror responses, in ms.')
+    parser.add_argument('--jitter', type=float, default=0, help='Random variation of the latency, in ms.')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of responses with HTTP 503.')
+    parser.add_argument('--delay', type=float, default=0, help='scraper.REQUEST_DELAY during the crawl, in seconds.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Also report the Python heap peak with tracemalloc (slows down the crawl).')
+    args = parser.parse_args()
+
+    counter = multiprocessing.Value('i', 0)
+    port_queue = multiprocessing.Queue()
+    mirror = multiprocessing.Process(target=serve, args=(args, counter, port_queue), daemon=True)
+    mirror.start()
+    try:
+        scraper.BASE_URL = f'http://127.0.0.1:{port_queue.get(timeout=60)}/'
+        scraper.REQUEST_DELAY = args.delay
+        if args.trace_memory:
+            tracemalloc.start()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        books = scraper.scrape_books() or []
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        heap_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    finally:
+        mirror.terminate()
+        mirror.join()
+
+    pages = counter.value
+    print("*************************************************************************************************")
+    print(f"Crawl of {args.books} books (latency {args.latency} ms, jitter {args.jitter} ms, "
+          f"error rate {args.error_rate}, delay {args.delay} s):")
+    print(f"\tBooks scraped: {len(books)}")
+    print(f"\tPages fetched: {pages} in {wall:.2f} s")
+    print(f"\tThroughput: {pages / wall:.1f} pages/s")
+    print(f"\tCPU per page: {cpu / max(pages, 1) * 1000:.2f} ms")
+    # ru_maxrss is reported in kilobytes on Linux.
+    print(f"\tPeak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    if heap_peak is not None:
+        print(f"\tPeak Python heap (tracemalloc): {heap_peak / 1024 / 1024:.1f} MB")
+
+if __name__ == '__main__':
+    main()
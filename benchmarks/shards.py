@@ -0,0 +1,80 @@
+"""
+Compares the catalogue in a single SQLite database against the same number of books split into shards
+(DATABASE_SHARDS), queried in parallel and merged by the API:
+- latency of the catalogue-wide endpoints (search, search with facets, stats, price range);
+- correctness: the merged responses have the same totals as the single database.
+
+Usage:
+    python -m benchmarks.shards --books 400000 --shards 1,2,4 --requests 30
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from urllib.parse import urlencode
+
+from benchmarks import synthetic
+from benchmarks.http_load import percentile
+
+def build_app(db_path, shard_paths):
+    """
+    Builds the application with create_app(): 'db_path' is the primary shard, 'shard_paths' the other ones.
+    """
+    os.environ['DATABASE_PATH'] = db_path
+    os.environ['DATABASE_SHARDS'] = ','.join(f'shard{i}={path}' for i, path in enumerate(shard_paths, start=1))
+    os.environ['SCRAPE_ON_BOOT'] = 'false'
+    from api.app import create_app
+    return create_app()
+
+def build_shards(work_dir, total_books, total_shards, seed):
+    """
+    Splits 'total_books' synthetic books into 'total_shards' databases (a different seed per shard).
+    """
+    paths = []
+    for index in range(total_shards):
+        path = os.path.join(work_dir, f'books-{total_shards}-{index}.db')
+        shard_books = total_books // total_shards + (index < total_books % total_shards)
+        synthetic.build_catalogue(path, shard_books, seed + index)
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=400_000, help='Total number of books of the catalogue.')
+    parser.add_argument('--shards', default='1,2,4', help='Comma separated numbers of shards.')
+    parser.add_argument('--requests', type=int, default=30, help='Requests measured per endpoint.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    endpoints = {
+        'search': lambda: '/api/v1/books/search?' + urlencode({'title': rng.choice(synthetic.WORDS)}),
+        'search_facets': lambda: '/api/v1/books/search?' + urlencode({'title': rng.choice(synthetic.WORDS), 'facets': 'true'}),
+        'stats_overview': lambda: '/api/v1/stats/overview',
+        'stats_categories': lambda: '/api/v1/stats/categories',
+        'price_range': lambda: '/api/v1/books/price-range?' + urlencode({'min': 20, 'max': 21}),
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        print("*************************************************************************************************")
+        print(f"{args.books} books, {args.requests} requests per endpoint (in-process, {os.cpu_count()} CPUs):")
+        for total_shards in (int(value) for value in args.shards.split(',')):
+            paths = build_shards(work_dir, args.books, total_shards, args.seed)
+            client = build_app(paths[0], paths[1:]).test_client()
+            totals = client.get('/api/v1/stats/overview').get_json()['total_books']
+            print(f"\t{total_shards} shard(s), total_books={totals}:")
+            for name, endpoint in endpoints.items():
+                # The first request builds the per-shard indexes (facets).
+                assert client.get(endpoint()).status_code == 200
+                durations = []
+                for _ in range(args.requests):
+                    url = endpoint()
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    durations.append((time.perf_counter() - start) * 1000)
+                    assert response.status_code == 200, (url, response.status_code)
+                print(f"\t\t{name:<17} median {statistics.median(durations):7.2f} ms   p95 {percentile(sorted(durations), 95):7.2f} ms")
+        print("*************************************************************************************************")
+
+if __name__ == '__main__':
+    main()
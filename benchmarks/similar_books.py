@@ -0,0 +1,53 @@
+"""
+Measures the similar books index of api/ml.py on the synthetic catalogues: build time,
+single query latency (p50/p95/p99) and batched query throughput.
+
+Usage:
+    python -m benchmarks.similar_books --sizes 1k,100k,1m --queries 500 --k 10 --batch 100
+"""
+import time
+import random
+import sqlite3
+import argparse
+
+from api import ml
+from benchmarks import synthetic
+from benchmarks.http_load import percentile
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(synthetic.SIZES), help='Comma separated catalogue sizes.')
+    parser.add_argument('--queries', type=int, default=500, help='Number of single queries measured.')
+    parser.add_argument('--k', type=int, default=10, help='Number of similar books per query.')
+    parser.add_argument('--batch', type=int, default=100, help='Number of IDs per batched query.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    print("*************************************************************************************************")
+    for size_name in args.sizes.split(','):
+        conn = sqlite3.connect(synthetic.ensure_catalogue(size_name))
+        start = time.perf_counter()
+        rows = conn.execute('SELECT id, title, category, rating, price FROM books ORDER BY id').fetchall()
+        loaded = time.perf_counter()
+        index = ml.SimilarBooksIndex(rows)
+        built = time.perf_counter()
+        conn.close()
+        total_books = len(index)
+        latencies = []
+        for _ in range(args.queries):
+            book_id = rng.randint(1, total_books)
+            query_start = time.perf_counter()
+            index.similar([book_id], args.k)
+            latencies.append((time.perf_counter() - query_start) * 1000)
+        latencies.sort()
+        batch = [rng.randint(1, total_books) for _ in range(args.batch)]
+        batch_start = time.perf_counter()
+        index.similar(batch, args.k)
+        batch_time = time.perf_counter() - batch_start
+        print(f"{size_name} ({total_books} books): load {loaded - start:.2f} s, build {built - loaded:.2f} s")
+        print(f"\tSingle query (k={args.k}): p50 {percentile(latencies, 50):.2f} ms   "
+              f"p95 {percentile(latencies, 95):.2f} ms   p99 {percentile(latencies, 99):.2f} ms")
+        print(f"\tBatch of {args.batch}: {batch_time * 1000:.1f} ms ({args.batch / batch_time:.0f} queries/s)")
+
+if __name__ == '__main__':
+    main()
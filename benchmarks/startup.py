@@ -0,0 +1,145 @@
+"""
+Measures the startup of the API workers.
+
+- Cold start: fresh interpreters running import + create_app() (median of --repeats runs), the modules
+  that were loaded, and the first /apispec_1.json request with the precomputed spec and built by flasgger.
+- Gunicorn (--gunicorn): boots gunicorn with and without preload_app and reports the boot time and the
+  total memory of the master and the workers (RSS and PSS, which splits the pages shared copy-on-write),
+  after the machine learning endpoints were used in every worker.
+
+Usage:
+    python -m benchmarks.startup --repeats 5
+    python -m benchmarks.startup --gunicorn --workers 4 --size 1k
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+from benchmarks import synthetic
+
+# Runs in a fresh interpreter and prints its measures as JSON.
+COLD_START = """
+import json, sys, time, resource
+start = time.perf_counter()
+from api.app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+client = app.test_client()
+spec_start = time.perf_counter()
+client.get('/apispec_1.json')
+spec_precomputed = time.perf_counter() - spec_start
+app.swag.apispecs.clear()
+spec_start = time.perf_counter()
+client.get('/apispec_1.json')
+spec_built = time.perf_counter() - spec_start
+heavy = [name for name in ('requests', 'bs4', 'numpy', 'scipy', 'scripts.scraper', 'api.ml') if name in sys.modules]
+print(json.dumps({
+    'import': imported - start, 'create_app': created - imported,
+    'spec_precomputed': spec_precomputed, 'spec_built': spec_built,
+    'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 'heavy': heavy
+}))
+"""
+
+def cold_start(repeats, env):
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START], env=env, capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return runs
+
+def process_tree(pid):
+    """
+    The process 'pid' and its children (Linux /proc).
+    """
+    pids = [pid]
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as children:
+            pids += [int(child) for child in children.read().split()]
+    return pids
+
+def memory(pid):
+    """
+    (RSS, PSS) of the process 'pid', in MB.
+    """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as smaps:
+        for line in smaps:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                values[key] = int(rest.split()[0]) / 1024
+    return values.get('Rss', 0), values.get('Pss', 0)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def boot_gunicorn(workers, preload, env, requests_per_worker=20, timeout=120):
+    port = free_port()
+    env = dict(env, GUNICORN_PRELOAD='true' if preload else 'false')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', '--access-logfile', '/dev/null', 'api.app:create_app()'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        start = time.perf_counter()
+        base_url = f'http://127.0.0.1:{port}/api/v1'
+        while True:
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError('gunicorn did not start.')
+            try:
+                urllib.request.urlopen(f'{base_url}/health', timeout=5).read()
+                break
+            except OSError:
+                time.sleep(0.02)
+        # Wait until every worker was forked.
+        while len(process_tree(server.pid)) < workers + 1:
+            time.sleep(0.02)
+        booted = time.perf_counter() - start
+        # Loads the similar books index (NumPy/SciPy) in the workers.
+        for book_id in range(1, workers * requests_per_worker + 1):
+            urllib.request.urlopen(f'{base_url}/books/{book_id}/similar?k=5', timeout=60).read()
+        rss, pss = zip(*(memory(pid) for pid in process_tree(server.pid)))
+        return booted, sum(rss), sum(pss)
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5, help='Cold starts measured.')
+    parser.add_argument('--gunicorn', action='store_true', help='Also boot gunicorn with and without preload_app.')
+    parser.add_argument('--workers', type=int, default=4, help='Gunicorn workers.')
+    parser.add_argument('--size', default='1k', choices=synthetic.SIZES, help='Catalogue used by gunicorn.')
+    args = parser.parse_args()
+    env = dict(os.environ, SCRAPE_ON_BOOT='false', JWT_SECRET_KEY=os.environ.get('JWT_SECRET_KEY', 'benchmark'))
+
+    runs = cold_start(args.repeats, env)
+    median = {key: statistics.median(run[key] for run in runs) for key in runs[0] if key != 'heavy'}
+    print("*************************************************************************************************")
+    print(f"Cold start (median of {args.repeats}):")
+    print(f"\timport {median['import'] * 1000:.0f} ms   create_app() {median['create_app'] * 1000:.0f} ms   "
+          f"peak RSS {median['rss']:.1f} MB")
+    print(f"\tLoaded at startup: {', '.join(runs[0]['heavy']) or 'no heavy module (requests, bs4, numpy, scipy)'}")
+    print(f"\tFirst /apispec_1.json: {median['spec_precomputed'] * 1000:.1f} ms precomputed, "
+          f"{median['spec_built'] * 1000:.1f} ms built by flasgger")
+
+    if args.gunicorn:
+        env['DATABASE_PATH'] = synthetic.ensure_catalogue(args.size)
+        print(f"Gunicorn ({args.workers} workers, {args.size} books):")
+        for preload in (False, True):
+            booted, rss, pss = boot_gunicorn(args.workers, preload, env)
+            print(f"\tpreload_app={preload!s:<5}: boot {booted:.2f} s   total RSS {rss:.0f} MB   total PSS {pss:.0f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Generates synthetic 'books.db' catalogues, with the real schema from scraper.setup_database(), for benchmarks.
+
+Usage:
+    python -m benchmarks.synthetic --sizes 1k,100k,1m
+"""
+import os
+import random
+import sqlite3
+import argparse
+
+from scripts import scraper
+
+DATA_DIR = os.path.join('benchmarks', 'data')
+# Catalogue sizes used by the benchmarks.
+SIZES = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1m': 1_000_000
+}
+CATEGORIES = [
+    'Travel', 'Mystery', 'Historical Fiction', 'Sequential Art', 'Classics', 'Philosophy', 'Romance',
+    'Womens Fiction', 'Fiction', 'Childrens', 'Religion', 'Nonfiction', 'Music', 'Default', 'Science Fiction',
+    'Sports and Games', 'Add a comment', 'Fantasy', 'New Adult', 'Young Adult', 'Science', 'Poetry', 'Paranormal',
+    'Art', 'Psychology', 'Autobiography', 'Parenting', 'Adult Fiction', 'Humor', 'Horror', 'History',
+    'Food and Drink', 'Christian Fiction', 'Business', 'Biography', 'Thriller', 'Contemporary', 'Spirituality',
+    'Academic', 'Self Help', 'Historical', 'Christian', 'Suspense', 'Short Stories', 'Novels', 'Health',
+    'Politics', 'Cultural', 'Erotica', 'Crime'
+]
+WORDS = [
+    'Light', 'Attic', 'Street', 'Night', 'Secret', 'Garden', 'House', 'River', 'Shadow', 'Dream', 'Fire', 'Stone',
+    'Moon', 'Sun', 'Love', 'War', 'Girl', 'Boy', 'King', 'Queen', 'Road', 'Sea', 'Winter', 'Summer', 'Story',
+    'Life', 'Death', 'World', 'Heart', 'Time', 'City', 'Island', 'Storm', 'Silence', 'Glass', 'Iron', 'Golden'
+]
+BATCH_SIZE = 50_000
+
+def catalogue_path(size_name):
+    """
+    Returns the path of the synthetic catalogue for a size name (e.g. '100k').
+    """
+    return os.path.join(DATA_DIR, f'books-{size_name}.db')
+
+def generate_books(total_books, seed=42):
+    """
+    Yields 'total_books' synthetic rows (title, price, rating, availability, category, image_url).
+    Titles are unique because they end with the book number.
+    """
+    rng = random.Random(seed)
+    for i in range(total_books):
+        title = ' '.join(rng.choices(WORDS, k=rng.randint(2, 6))) + f' #{i}'
+        yield (
+            title,
+            round(rng.uniform(10, 60), 2),
+            rng.randint(1, 5),
+            str(rng.randint(0, 22)),
+            rng.choice(CATEGORIES),
+            f'https://books.toscrape.com/media/cache/{rng.getrandbits(64):016x}/{rng.getrandbits(64):016x}.jpg'
+        )
+
+def build_catalogue(db_path, total_books, seed=42):
+    """
+    Creates (or recreates) a database at 'db_path' with 'total_books' synthetic books.
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    scraper.setup_database(db_path)
+    conn = sqlite3.connect(db_path)
+    sql_insert = 'INSERT INTO books (title, price, rating, availability, category, image_url) VALUES (?, ?, ?, ?, ?, ?)'
+    batch = []
+    for book in generate_books(total_books, seed):
+        batch.append(book)
+        if len(batch) == BATCH_SIZE:
+            conn.executemany(sql_insert, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql_insert, batch)
+    conn.commit()
+    conn.close()
+
+def ensure_catalogue(size_name, seed=42):
+    """
+    Returns the path of the synthetic catalogue for 'size_name', generating it if it does not exist yet.
+    """
+    db_path = catalogue_path(size_name)
+    if not os.path.exists(db_path):
+        print(f"Generating synthetic catalogue with {SIZES[size_name]} books at {db_path}...")
+        build_catalogue(db_path, SIZES[size_name], seed)
+    return db_path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(SIZES), help=f"Comma separated sizes: {', '.join(SIZES)}.")
+    parser.add_argument('--seed', type=int, default=42, help='Random seed, so catalogues are reproducible.')
+    args = parser.parse_args()
+    for size_name in args.sizes.split(','):
+        db_path = catalogue_path(size_name)
+        print(f"Generating synthetic catalogue with {SIZES[size_name]} books at {db_path}...")
+        build_catalogue(db_path, SIZES[size_name], args.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Offline mirror of books.toscrape.com, used to benchmark the scraper without hitting the live website.
+
+Reproduces the catalogue pagination (20 books per 'catalogue/page-N.html'), the 'product_pod' listing
+markup and the book detail pages read by scripts/scraper.py, with a synthetic catalogue of any size.
+The covers ('media/cache/...jpg') are small BMP images; several books share the same cover, like on the
+real website. Latency, jitter and error rate of the responses are configurable.
+
+Usage:
+    python -m benchmarks.toscrape_mirror --books 1000 --latency 20 --jitter 5 --error-rate 0.01 --port 8001
+    SCRAPER_BASE_URL=http://127.0.0.1:8001/ python -c "from scripts import scraper; scraper.run_scraping_process()"
+"""
+import re
+import time
+import struct
+import random
+import argparse
+from html import escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from benchmarks import synthetic
+
+BOOKS_PER_PAGE = 20
+RATING_WORDS = ['One', 'Two', 'Three', 'Four', 'Five']
+LISTING_PATH = re.compile(r'^/catalogue/page-(\d+)\.html$')
+DETAIL_PATH = re.compile(r'^/catalogue/[a-z0-9-]+_(\d+)/index\.html$')
+IMAGE_PATH = re.compile(r'^/media/cache/[0-9a-f]{2}/([0-9a-f]{8})\.jpg$')
+# Number of distinct covers: the books beyond it share covers, which the image store de-duplicates.
+COVER_VARIANTS = 64
+
+def render_cover(variant, width=60, height=90):
+    """
+    Returns a 24-bit BMP cover, a vertical gradient whose colour depends on 'variant'.
+    """
+    row_size = (width * 3 + 3) & ~3
+    red, green, blue = (variant * 37) % 256, (variant * 91) % 256, (variant * 53) % 256
+    pixels = b''.join(
+        (bytes((blue, green, (red + y) % 256)) * width).ljust(row_size, b'\0') for y in range(height)
+    )
+    header = struct.pack('<2sIHHI', b'BM', 54 + len(pixels), 0, 0, 54)
+    info = struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0, len(pixels), 2835, 2835, 0, 0)
+    return header + info + pixels
+
+def build_catalogue(total_books, seed=42):
+    """
+    Returns the list of synthetic books served by the mirror.
+    """
+    catalogue = []
+    for i, (title, price, rating, availability, category, _) in enumerate(synthetic.generate_books(total_books, seed)):
+        catalogue.append({
+            'slug': f"{re.sub(r'[^a-z0-9]+', '-', title.lower()).strip('-')}_{i + 1}",
+            'title': title,
+            'price': price,
+            'rating': RATING_WORDS[rating - 1],
+            'availability': availability,
+            'category': category,
+            'image': f'media/cache/{i % 256:02x}/{i:08x}.jpg'
+        })
+    return catalogue
+
+def render_listing(catalogue, page):
+    """
+    Listing page 'catalogue/page-N.html', with one <article class="product_pod"> per book.
+    """
+    books = catalogue[(page - 1) * BOOKS_PER_PAGE:page * BOOKS_PER_PAGE]
+    pods = ''.join(
+        f'''
+            <li class="col-xs-6 col-sm-4 col-md-3 col-lg-3">
+                <article class="product_pod">
+                    <div class="image_container">
+                        <a href="{book['slug']}/index.html"><img src="../{book['image']}" alt="{escape(book['title'])}" class="thumbnail"></a>
+                    </div>
+                    <p class="star-rating {book['rating']}"><i class="icon-star"></i></p>
+                    <h3><a href="{book['slug']}/index.html" title="{escape(book['title'])}">{escape(book['title'][:40])}</a></h3>
+                    <div class="product_price">
+                        <p class="price_color">£{book['price']:.2f}</p>
+                        <p class="instock availability"><i class="icon-ok"></i> In stock</p>
+                    </div>
+                </article>
+            </li>'''
+        for book in books
+    )
+    total_pages = max(1, -(-len(catalogue) // BOOKS_PER_PAGE))
+    pager = f'<li class="current">Page {page} of {total_pages}</li>'
+    if page > 1:
+        pager = f'<li class="previous"><a href="page-{page - 1}.html">previous</a></li>' + pager
+    if page < total_pages:
+        pager += f'<li class="next"><a href="page-{page + 1}.html">next</a></li>'
+    return f'''<!DOCTYPE html>
+<html lang="en-us">
+<head><title>All products | Books to Scrape - Sandbox</title></head>
+<body>
+    <div class="page_inner">
+        <section>
+            <ol class="row">{pods}
+            </ol>
+            <div><ul class="pager">{pager}</ul></div>
+        </section>
+    </div>
+</body>
+</html>'''
+
+def render_detail(book):
+    """
+    Book detail page 'catalogue/<slug>_<id>/index.html'.
+    """
+    title = escape(book['title'])
+    return f'''<!DOCTYPE html>
+<html lang="en-us">
+<head><title>{title} | Books to Scrape - Sandbox</title></head>
+<body>
+    <div class="page_inner">
+        <ul class="breadcrumb">
+            <li><a href="../../index.html">Home</a></li>
+            <li><a href="../category/books_1/index.html">Books</a></li>
+            <li><a href="../category/books/{book['slug']}/index.html">{escape(book['category'])}</a></li>
+            <li class="active">{title}</li>
+        </ul>
+        <article class="product_page">
+            <div class="row">
+                <div class="col-sm-6">
+                    <div id="product_gallery" class="carousel">
+                        <div class="thumbnail"><div class="carousel-inner"><div class="item active">
+                            <img src="../../{book['image']}" alt="{title}" />
+                        </div></div></div>
+                    </div>
+                </div>
+                <div class="col-sm-6 product_main">
+                    <h1>{title}</h1>
+                    <p class="price_color">£{book['price']:.2f}</p>
+                    <p class="instock availability">
+                        <i class="icon-ok"></i>
+                        In stock ({book['availability']} available)
+                    </p>
+                    <p class="star-rating {book['rating']}"><i class="icon-star"></i></p>
+                </div>
+            </div>
+        </article>
+    </div>
+</body>
+</html>'''
+
+def make_handler(catalogue, latency, jitter, error_rate, seed=42, counter=None):
+    """
+    Builds the request handler class of the mirror.
+    'latency' and 'jitter' are in milliseconds, 'error_rate' is the fraction of requests answered with 503.
+    'counter' is an optional multiprocessing.Value incremented on every request.
+    """
+    rng = random.Random(seed)
+
+    class MirrorHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if counter is not None:
+                with counter.get_lock():
+                    counter.value += 1
+            delay = latency + rng.uniform(-jitter, jitter)
+            if delay > 0:
+                time.sleep(delay / 1000)
+            if rng.random() < error_rate:
+                return self.send_body(503, 'Service Unavailable')
+            listing = LISTING_PATH.match(self.path)
+            detail = DETAIL_PATH.match(self.path)
+            image = IMAGE_PATH.match(self.path)
+            if image and int(image.group(1), 16) < len(catalogue):
+                return self.send_body(200, render_cover(int(image.group(1), 16) % COVER_VARIANTS), 'image/bmp')
+            if listing and 1 <= int(listing.group(1)) <= max(1, -(-len(catalogue) // BOOKS_PER_PAGE)):
+                return self.send_body(200, render_listing(catalogue, int(listing.group(1))))
+            if detail and 1 <= int(detail.group(1)) <= len(catalogue):
+                return self.send_body(200, render_detail(catalogue[int(detail.group(1)) - 1]))
+            return self.send_body(404, 'Not Found')
+
+        def send_body(self, status, body, content_type='text/html'):
+            # Like the real website, no charset is sent: requests decodes the UTF-8 '£' as 'Â£'.
+            data = body.encode('utf-8') if isinstance(body, str) else body
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MirrorHandler
+
+def make_server(host, port, total_books, latency=0, jitter=0, error_rate=0, seed=42, counter=None):
+    """
+    Returns a ThreadingHTTPServer serving a mirror with 'total_books' books.
+    """
+    handler = make_handler(build_catalogue(total_books, seed), latency, jitter, error_rate, seed, counter)
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=1000, help='Catalogue size (the real website has 1000).')
+    parser.add_argument('--latency', type=float, default=0, help='Latency added to every response, in ms.')
+    parser.add_argument('--jitter', type=float, default=0, help='Random variation of the latency, in ms.')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of responses with HTTP 503.')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed of the catalogue and of the errors.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.books, args.latency, args.jitter, args.error_rate, args.seed)
+    print(f"Mirror of books.toscrape.com with {args.books} books at http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,39 @@
 import os
+import shutil
+import tempfile
+
+# Diretório compartilhado pelos workers para agregar as métricas do Prometheus (/metrics).
+# Precisa ser definido antes de a aplicação importar o prometheus_client.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'books-api-metrics'))
+# Remove as métricas de execuções anteriores e cria o diretório já aqui: com preload_app, a aplicação
+# (e os arquivos das métricas) é carregada no master antes do hook on_starting.
+shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+# Importado aqui, e não em child_exit: o hook roda no handler de SIGCHLD do master, que é reentrado
+# quando vários workers saem ao mesmo tempo (desligamento), e o segundo import via o módulo pela metade.
+from prometheus_client import multiprocess  # noqa: E402
 # O endereço IP e a porta onde o Gunicorn irá escutar.
 bind = "0.0.0.0:8000"
 # Número de workers (processos) para lidar com requisições.
 workers = (os.cpu_count() * 2) + 1
+# Threads por worker (GUNICORN_THREADS). As requisições simultâneas de /predict de um mesmo
+# worker são agrupadas em micro-batches.
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+# Tipo de worker (GUNICORN_WORKER_CLASS). Com 'gthread' (padrão) ou 'gevent' (se instalado), cada conexão
+# de /changes/stream ocupa uma thread/greenlet, e não um worker inteiro.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# Conexões de /changes/stream por worker (CHANGES_MAX_STREAMS), lido pela aplicação: com 'gthread',
+# sempre sobra uma thread para as outras rotas; com 'sync', o stream é recusado (503) e o cliente usa /changes.
+# O gunicorn usa 'gthread' quando 'sync' é configurado com mais de uma thread.
+effective_worker_class = 'gthread' if worker_class == 'sync' and threads > 1 else worker_class
+if effective_worker_class == 'gthread':
+    os.environ.setdefault('CHANGES_MAX_STREAMS', str(threads - 1))
+elif effective_worker_class == 'sync':
+    os.environ.setdefault('CHANGES_MAX_STREAMS', '0')
+# Carrega a aplicação uma única vez no master, antes do fork (GUNICORN_PRELOAD=true).
+# Os módulos e dados carregados são compartilhados pelos workers (copy-on-write) e o scraping
+# inicial roda uma vez, e não em cada worker.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() == 'true'
 
 # Nível de log. 
 # Opções: 'debug', 'info', 'warning', 'error', 'critical'
@@ -10,3 +41,16 @@ loglevel = "info"
 accesslog = "-"
 errorlog = "-"
 timeout = 120
+
+def when_ready(server):
+    if preload_app:
+        # Importa também os módulos carregados sob demanda (NumPy/SciPy), para que sejam compartilhados.
+        import api.ml  # noqa: F401
+        # Move os objetos atuais para fora do coletor de lixo: sem isso, as coletas nos workers
+        # escrevem nos objetos herdados e as páginas compartilhadas são copiadas.
+        import gc
+        gc.freeze()
+
+def child_exit(server, worker):
+    # Descarta as métricas "live" do worker finalizado, mantendo os contadores acumulados.
+    multiprocess.mark_process_dead(worker.pid)
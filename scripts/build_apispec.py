@@ -0,0 +1,28 @@
+"""
+Generates the OpenAPI spec of the API (api/apispec.json) from the YAML docstrings of the routes.
+Run it at build time (after installing the dependencies), as the Procfile does before starting gunicorn:
+the workers load the file instead of parsing every docstring. The file carries a fingerprint of the routes and is ignored once they change.
+
+Usage:
+    python -m scripts.build_apispec
+"""
+import os
+import json
+
+os.environ['SCRAPE_ON_BOOT'] = 'false'
+
+from api import app as api_app
+
+def main():
+    app = api_app.create_app()
+    with app.app_context():
+        # Generated by flasgger itself, so the file is identical to the lazily built spec.
+        app.swag.apispecs.pop('apispec_1', None)
+        spec = dict(app.swag.get_apispecs('apispec_1'))
+    spec['x-source-fingerprint'] = api_app.apispec_fingerprint(app)
+    with open(api_app.APISPEC_PATH, 'w', encoding='utf-8') as spec_file:
+        json.dump(spec, spec_file, ensure_ascii=False, separators=(',', ':'))
+    print(f"OpenAPI spec written to {api_app.APISPEC_PATH} ({len(spec.get('paths', {}))} paths).")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import os
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+# Pillow (requirements.txt) generates the thumbnails. Without it the originals are still stored and served,
+# but no thumbnails are generated and download_images() warns about it.
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Same setting as the API (IMAGE_DIR), which serves the images from this directory.
+IMAGE_DIR = os.environ.get('IMAGE_DIR', os.path.join('data', 'images'))
+# Concurrent image downloads (SCRAPER_IMAGE_WORKERS).
+DOWNLOAD_WORKERS = int(os.environ.get('SCRAPER_IMAGE_WORKERS', 8))
+# Largest side of the thumbnails, in pixels.
+THUMBNAIL_SIZE = 200
+EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp', 'image/bmp': 'bmp'}
+
+def image_path(image_dir, sha256, thumbnail=False):
+    """
+    Path of an image in the content-addressed store: '<image_dir>/<originals|thumbnails>/<2 first chars>/<sha256>'.
+    The name is the SHA-256 of the original content, so the same image is stored only once.
+    """
+    return os.path.join(image_dir, 'thumbnails' if thumbnail else 'originals', sha256[:2], sha256)
+
+def _write_atomically(path, data):
+    # Written to a temporary file and renamed, so a reader never sees a partial image.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(data)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+def make_thumbnail(data):
+    """
+    Returns a JPEG thumbnail of the image 'data' (bytes), or None when Pillow is not installed
+    or the content is not an image it can read.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            output = BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=85, optimize=True)
+            return output.getvalue()
+    except Exception as e:
+        print(f"\tCould not generate a thumbnail: {e}")
+        return None
+
+def store_image(image_dir, data, stored, lock):
+    """
+    Stores the image 'data' (and its thumbnail) unless an image with the same content is already stored.
+    Returns a tuple (sha256, has_thumbnail, new).
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    while True:
+        with lock:
+            entry = stored.get(sha256)
+            if entry is None:
+                # Reserved while it is written, so concurrent downloads of the same content write it only once.
+                writing = stored[sha256] = threading.Event()
+                break
+        if not isinstance(entry, threading.Event):
+            return sha256, entry, False
+        # Another download is writing the same content: wait for it, and write it here if that one failed.
+        entry.wait()
+    try:
+        original = image_path(image_dir, sha256)
+        if not os.path.exists(original):
+            _write_atomically(original, data)
+        thumbnail = make_thumbnail(data) if not os.path.exists(image_path(image_dir, sha256, True)) else None
+        if thumbnail:
+            _write_atomically(image_path(image_dir, sha256, True), thumbnail)
+        has_thumbnail = os.path.exists(image_path(image_dir, sha256, True))
+        with lock:
+            stored[sha256] = has_thumbnail
+    except BaseException:
+        # Only images that were written are recorded: the next download of this content writes it again.
+        with lock:
+            del stored[sha256]
+        raise
+    finally:
+        writing.set()
+    return sha256, has_thumbnail, True
+
+def download_images(db_path, fetch, image_dir=IMAGE_DIR, workers=DOWNLOAD_WORKERS):
+    """
+    Downloads, concurrently, the cover of every book whose 'image_url' is not in the 'images' table yet,
+    and stores it in the content-addressed store of 'image_dir'.
+    'fetch' is a function (url, kind) -> response, like scraper.fetch_page.
+    Returns a dictionary with the number of images downloaded, new (stored) and failed.
+    """
+    conn = sqlite3.connect(db_path)
+    urls = [row[0] for row in conn.execute('''
+        SELECT DISTINCT image_url FROM books
+        WHERE image_url IS NOT NULL AND image_url NOT IN (SELECT url FROM images)
+    ''')]
+    stored = dict(conn.execute('SELECT sha256, MAX(has_thumbnail) FROM images GROUP BY sha256').fetchall())
+    conn.close()
+    lock = threading.Lock()
+
+    def download(url):
+        try:
+            response = fetch(url, 'image')
+            content_type = response.headers.get('Content-Type', 'application/octet-stream').split(';')[0].strip()
+            sha256, has_thumbnail, new = store_image(image_dir, response.content, stored, lock)
+            return url, sha256, content_type, len(response.content), has_thumbnail, new
+        except Exception as e:
+            print(f"\tAn error occurred downloading the image {url}: {e}")
+            return None
+
+    print(f"Downloading {len(urls)} images with {workers} workers...")
+    if Image is None:
+        print("\tPillow is not installed: no thumbnails will be generated ('?size=thumb' serves the originals).")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = [result for result in executor.map(download, urls) if result]
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT OR REPLACE INTO images (url, sha256, content_type, size, has_thumbnail) VALUES (?, ?, ?, ?, ?)',
+        [result[:5] for result in results]
+    )
+    conn.commit()
+    conn.close()
+    summary = {
+        'downloaded': len(results),
+        'new': sum(1 for result in results if result[5]),
+        'failed': len(urls) - len(results)
+    }
+    print(f"\tImages downloaded: {summary['downloaded']} ({summary['new']} new, {summary['failed']} failed).")
+    return summary
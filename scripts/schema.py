@@ -0,0 +1,42 @@
+def create_tables(conn):
+    """
+    Creates the tables of the catalogue database ('books', 'book_changes' and 'images') if they do not exist.
+    Used by the scraper and by the API on start, so databases created by older versions get the new tables.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL UNIQUE,
+            price REAL NOT NULL,
+            rating INTEGER,
+            availability TEXT,
+            category TEXT,
+            image_url TEXT
+        )
+    ''')
+    # Change log: one row per book inserted, updated or removed by each write of the scraper,
+    # tagged with the dataset version (PRAGMA user_version) of that write. Used by /changes.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS book_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            version INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            fields TEXT,
+            book TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_book_changes_version ON book_changes (version)')
+    # Local copies of the covers: 'sha256' is the name of the file in the content-addressed store.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            url TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            has_thumbnail INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_sha256 ON images (sha256)')
+    conn.commit()
@@ -1,46 +1,80 @@
 import os
 import csv
+import json
 import time
 import sqlite3
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
+from prometheus_client import Counter, Histogram
+
+from scripts import images, schema
 
 DIR = 'data'
-BASE_URL = 'https://books.toscrape.com/'
+# Can point at a local mirror (e.g. benchmarks/toscrape_mirror.py) with SCRAPER_BASE_URL.
+BASE_URL = os.environ.get('SCRAPER_BASE_URL', 'https://books.toscrape.com/')
+# Pause between book detail requests, in seconds, to be polite with the source website.
+REQUEST_DELAY = float(os.environ.get('SCRAPER_REQUEST_DELAY', 0.1))
+# Downloads the book covers to the local image store (scripts/images.py) after each scraping.
+DOWNLOAD_IMAGES = os.environ.get('SCRAPER_DOWNLOAD_IMAGES', 'false').lower() == 'true'
 DB_NAME = 'books.db'
 CSV_NAME = 'scraped_books.csv'
 
-def setup_database():
+# Scraping metrics, exposed by the API at /metrics.
+PAGES_FETCHED = Counter('books_scraper_pages_fetched_total', 'Pages fetched by the scraper.', ['kind', 'status'])
+FETCH_LATENCY = Histogram('books_scraper_fetch_duration_seconds', 'Time to fetch a page.', ['kind'])
+PARSE_DURATION = Histogram('books_scraper_parse_duration_seconds', 'Time to parse a page.', ['kind'])
+ROWS_UPSERTED = Counter('books_scraper_rows_upserted_total', 'Rows written to the database by the scraper.')
+ROWS_DELETED = Counter('books_scraper_rows_deleted_total', 'Rows removed from the database by the scraper.')
+
+# Dataset versions kept in 'book_changes' (SCRAPER_CHANGES_RETENTION): older changes are pruned on each write.
+CHANGES_RETENTION = int(os.environ.get('SCRAPER_CHANGES_RETENTION', 100))
+# Columns of the 'books' table written by the scraper, besides the ID.
+BOOK_COLUMNS = ('title', 'price', 'rating', 'availability', 'category', 'image_url')
+
+def fetch_page(url, kind):
+    """
+    Fetches a page ('listing', 'detail' or 'image'), recording its latency and status.
+    Raise an exception for bad HTTP status (4xx or 5xx).
+    """
+    start = time.perf_counter()
+    try:
+        response = requests.get(url)
+    except requests.exceptions.RequestException:
+        PAGES_FETCHED.labels(kind, 'error').inc()
+        raise
+    FETCH_LATENCY.labels(kind).observe(time.perf_counter() - start)
+    PAGES_FETCHED.labels(kind, response.status_code).inc()
+    response.raise_for_status()
+    return response
+
+def setup_database(output_filepath=os.path.join(DIR, DB_NAME)):
     """
     Function responsible for creating the SQLite database and the 'books' table if they do not exist.
+    The database is created at 'data/books.db' unless another path is informed.
     """
     print("*************************************************************************************************")
     print("Setting up the database...")
-    os.makedirs(DIR, exist_ok=True)
-    output_filepath = os.path.join(DIR, DB_NAME)
+    os.makedirs(os.path.dirname(output_filepath) or '.', exist_ok=True)
     conn = sqlite3.connect(output_filepath)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL UNIQUE,
-            price REAL NOT NULL,
-            rating INTEGER,
-            availability TEXT,
-            category TEXT,
-            image_url TEXT
-        )
-    ''')
-    conn.commit()
+    schema.create_tables(conn)
     conn.close()
 
 def scrape_books():
     """
     Function responsible for extracting data from the website 'books.toscrape.com'.
     """
+    return scrape_catalogue()[0]
+
+def scrape_catalogue(base_url=None):
+    """
+    Extracts the books of the website 'books.toscrape.com' (or of 'base_url', for the other shards).
+    Returns a tuple (books, complete): 'complete' is False when the scraping stopped at an error,
+    in which case the books that were not reached must not be considered removed.
+    """
     all_books_data = []
-    url_to_scrape = urljoin(BASE_URL, 'catalogue/page-1.html')
+    complete = False
+    url_to_scrape = urljoin(base_url or BASE_URL, 'catalogue/page-1.html')
     rating_map = {
         'One': 1,
         'Two': 2,
@@ -53,19 +87,20 @@ def scrape_books():
     while url_to_scrape:
         print(f"\tPage: {url_to_scrape}")
         try:
-            response = requests.get(url_to_scrape)
-            response.raise_for_status() # Raise an exception for bad HTTP status (4xx or 5xx).
+            response = fetch_page(url_to_scrape, 'listing')
+            parse_start = time.perf_counter()
             soup = BeautifulSoup(response.text, 'html.parser')
             # Get all books on the listing page.
             # Each book is inside an <article class="product_pod"> tag.
             books_on_page = soup.find_all('article', class_='product_pod')
+            PARSE_DURATION.labels('listing').observe(time.perf_counter() - parse_start)
             for book in books_on_page:
                 # Get url to the book detail page.
                 book_relative_url = book.find('h3').find('a')['href']
                 book_full_url = urljoin(url_to_scrape, book_relative_url)
                 # Book detail
-                book_response = requests.get(book_full_url)
-                book_response.raise_for_status()
+                book_response = fetch_page(book_full_url, 'detail')
+                parse_start = time.perf_counter()
                 book_soup = BeautifulSoup(book_response.text, 'html.parser')
                 title = book_soup.find('h1').text
                 price = book_soup.find('p', class_='price_color').text
@@ -91,8 +126,9 @@ def scrape_books():
                     'category': category,
                     'image_url': image_full_url
                 }
+                PARSE_DURATION.labels('detail').observe(time.perf_counter() - parse_start)
                 all_books_data.append(book_data)
-                time.sleep(0.1)
+                time.sleep(REQUEST_DELAY)
             # Netx page
             next_button = soup.find('li', class_='next')
             if next_button:
@@ -100,16 +136,17 @@ def scrape_books():
                 url_to_scrape = urljoin(url_to_scrape, next_page_relative_url)
             else:
                 url_to_scrape = None
+                complete = True
         except requests.exceptions.RequestException as e:
             print(f"\tAn error occurred accessing the page \n{url_to_scrape}: {e}")
             break
     if not all_books_data:
         print("\tWeb scraping execution failed..")
-        return None
+        return None, False
     print(f"\tTotal books scraped: {len(all_books_data)}")
     print("Ending the Web Scraping...")
     print("*************************************************************************************************")
-    return all_books_data
+    return all_books_data, complete
 
 def save_to_csv(books_data):
     """
@@ -128,46 +165,81 @@ def save_to_csv(books_data):
     except IOError as e:
         print(f"\tAn error occurred while writing the CSV file: {e}")
 
-def save_to_sqlite(books_data):
+def save_to_sqlite(books_data, complete=False, output_filepath=os.path.join(DIR, DB_NAME)):
     """
-    Salva a lista de livros no banco de dados SQLite com os novos campos.
+    Salva a lista de livros no banco de dados SQLite: insere os livros novos e atualiza os que mudaram.
+    Se o scraping foi completo ('complete'), os livros que não estão mais no site são removidos.
+    Cada alteração é registrada em 'book_changes' com a nova versão do dataset, na mesma transação.
     """
     print("Saving the data in the SQLite database...")
-    output_filepath = os.path.join(DIR, DB_NAME)
     conn = sqlite3.connect(output_filepath)
     cursor = conn.cursor()
-    sql_insert = '''
-        INSERT OR IGNORE INTO books 
-        (title, price, rating, availability, category, image_url) 
-        VALUES (?, ?, ?, ?, ?, ?)
-    '''
+    existing = {
+        row[1]: row for row in cursor.execute(f"SELECT id, {', '.join(BOOK_COLUMNS)} FROM books")
+    }
+    sql_insert = f"INSERT INTO books ({', '.join(BOOK_COLUMNS)}) VALUES ({', '.join('?' for _ in BOOK_COLUMNS)})"
+    sql_update = f"UPDATE books SET {', '.join(f'{column} = ?' for column in BOOK_COLUMNS[1:])} WHERE id = ?"
+    # (book_id, operation, changed fields, book after the change)
+    changes = []
+    scraped_titles = set()
     for book in books_data:
-        cursor.execute(sql_insert,
-                        (
-                            book['title'], 
-                            book['price'], 
-                            book['rating'], 
-                            book['availability'], 
-                            book['category'], 
-                            book['image_url']
-                        ))
+        # Same types as the values read from the table, so unchanged books compare equal.
+        values = (
+            book['title'], float(book['price']), int(book['rating']),
+            book['availability'], book['category'], book['image_url']
+        )
+        if values[0] in scraped_titles:
+            continue
+        scraped_titles.add(values[0])
+        current = existing.get(values[0])
+        if current is None:
+            cursor.execute(sql_insert, values)
+            changes.append((cursor.lastrowid, 'insert', None, dict(zip(BOOK_COLUMNS, values))))
+        elif tuple(current[1:]) != values:
+            cursor.execute(sql_update, values[1:] + (current[0],))
+            fields = [column for column, old, new in zip(BOOK_COLUMNS, current[1:], values) if old != new]
+            changes.append((current[0], 'update', fields, dict(zip(BOOK_COLUMNS, values))))
+    if complete:
+        removed = [row[0] for title, row in existing.items() if title not in scraped_titles]
+        cursor.executemany('DELETE FROM books WHERE id = ?', [(book_id,) for book_id in removed])
+        changes += [(book_id, 'delete', None, None) for book_id in removed]
+    if changes:
+        # New dataset version, used by the API to rebuild its in-memory indexes (PRAGMA does not accept expressions).
+        version = cursor.execute('PRAGMA user_version').fetchone()[0] + 1
+        cursor.execute(f'PRAGMA user_version = {version}')
+        cursor.executemany(
+            'INSERT INTO book_changes (version, book_id, operation, fields, book) VALUES (?, ?, ?, ?, ?)',
+            [
+                (version, book_id, operation, fields and json.dumps(fields), book and json.dumps({'id': book_id, **book}))
+                for book_id, operation, fields, book in changes
+            ]
+        )
+        # Retention: /changes answers 410 to the clients that are behind the oldest version kept.
+        cursor.execute('DELETE FROM book_changes WHERE version <= ?', (version - CHANGES_RETENTION,))
     conn.commit()
     conn.close()
-    print(f"\tData stored successfully. The database can be found at: {output_filepath}")
+    deleted = sum(1 for change in changes if change[1] == 'delete')
+    ROWS_UPSERTED.inc(len(changes) - deleted)
+    ROWS_DELETED.inc(deleted)
+    print(f"\tData stored successfully ({len(changes)} changes). The database can be found at: {output_filepath}")
     print("*************************************************************************************************")
 
-def run_scraping_process():
+def run_scraping_process(base_url=None, db_path=None):
     """
     Função principal que orquestra todo o processo de scraping e salvamento.
     Esta é a função que será chamada em segundo plano.
+    Cada shard do catálogo é extraído do seu 'base_url' e salvo no seu próprio banco ('db_path').
     """
+    db_path = db_path or os.path.join(DIR, DB_NAME)
     print(">>> [BACKGROUND JOB] - Starting scraping process.")
     try:
-        setup_database()
-        books = scrape_books()
+        setup_database(db_path)
+        books, complete = scrape_catalogue(base_url)
         if books:
             # save_to_csv(books)
-            save_to_sqlite(books)
+            save_to_sqlite(books, complete, db_path)
+        if DOWNLOAD_IMAGES:
+            images.download_images(db_path, fetch_page)
         print(">>> [BACKGROUND JOB] - Scraping process completed successfully.")
     except Exception as e:
         print(f">>> [BACKGROUND JOB] - Error on scraping process: {e}")
@@ -0,0 +1,31 @@
+import os
+import threading
+
+import pytest
+
+from scripts import images
+
+def test_same_content_is_stored_once(tmp_path):
+    stored, lock = {}, threading.Lock()
+    first = images.store_image(str(tmp_path), b'cover', stored, lock)
+    second = images.store_image(str(tmp_path), b'cover', stored, lock)
+    assert first[0] == second[0]
+    assert (first[2], second[2]) == (True, False)
+    assert os.path.exists(images.image_path(str(tmp_path), first[0]))
+
+def test_failed_write_is_not_recorded(tmp_path, monkeypatch):
+    stored, lock = {}, threading.Lock()
+    original_write = images._write_atomically
+
+    def failing_write(path, data):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(images, '_write_atomically', failing_write)
+    with pytest.raises(OSError):
+        images.store_image(str(tmp_path), b'cover', stored, lock)
+    assert stored == {}
+    # The next download of the same content writes it.
+    monkeypatch.setattr(images, '_write_atomically', original_write)
+    sha256, _, new = images.store_image(str(tmp_path), b'cover', stored, lock)
+    assert new
+    assert os.path.exists(images.image_path(str(tmp_path), sha256))
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from api import ml
+
+TITLES = ['Dragon Magic Quest', 'The Dragon Sword', 'Stock Market Investing', 'Investing in Finance']
+CATEGORIES = ['Fantasy', 'Fantasy', 'Business', 'Business']
+
+@pytest.fixture
+def model():
+    title_counts = ml.hash_title_ngrams(TITLES, ml.PREDICTION_HASH_FEATURES)
+    return ml.NaiveBayesClassifier('genre', title_counts, CATEGORIES, [0, 0, 1, 1], ['fantasy', 'business'])
+
+def test_naive_bayes_predicts_the_class_of_similar_books(model):
+    predictions = model.predict(['Magic Dragon', 'Market Investing'], ['Fantasy', 'Business'])
+    assert [prediction['prediction'] for prediction in predictions] == ['fantasy', 'business']
+    for prediction in predictions:
+        assert set(prediction['probabilities']) == {'fantasy', 'business'}
+        assert sum(prediction['probabilities'].values()) == pytest.approx(1, abs=1e-3)
+
+def test_naive_bayes_uses_the_title_when_the_category_is_unknown(model):
+    predictions = model.predict(['Dragon Quest', 'Finance Investing'], ['Unknown', 'Unknown'])
+    assert [prediction['prediction'] for prediction in predictions] == ['fantasy', 'business']
+
+def test_price_band_model_labels_each_quantile():
+    prices = [10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0]
+    titles = [f'Book {i}' for i in range(len(prices))]
+    training_set = (ml.hash_title_ngrams(titles, ml.PREDICTION_HASH_FEATURES), ['Fiction'] * len(prices), [3] * len(prices), prices)
+    model = ml._train_price_band(training_set, version=1)
+    assert len(model.labels) == ml.PRICE_BANDS
+    assert model.labels[0].startswith('£10.00') and model.labels[-1].endswith('£80.00')
+    assert model.version == 1
+
+class RecordingModel:
+    """
+    Echoes the titles and records the size of every batch.
+    """
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def predict(self, titles, categories):
+        self.batches.append(len(titles))
+        if self.fail:
+            raise ValueError('model error')
+        return [{'prediction': title} for title in titles]
+
+def test_micro_batcher_groups_concurrent_predictions():
+    batcher = ml.MicroBatcher(window=0.2, max_batch=64)
+    model = RecordingModel()
+    results = {}
+
+    def predict(i):
+        results[i] = batcher.predict(model, f'title {i}', '')
+
+    threads = [threading.Thread(target=predict, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {i: {'prediction': f'title {i}'} for i in range(20)}
+    assert sum(model.batches) == 20
+    assert len(model.batches) < 20
+
+def test_micro_batcher_respects_max_batch():
+    batcher = ml.MicroBatcher(window=0.2, max_batch=4)
+    model = RecordingModel()
+    threads = [threading.Thread(target=batcher.predict, args=(model, f'title {i}', '')) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(model.batches) == 10
+    assert max(model.batches) <= 4
+
+def test_micro_batcher_raises_the_model_error():
+    batcher = ml.MicroBatcher(window=0)
+    with pytest.raises(ValueError, match='model error'):
+        batcher.predict(RecordingModel(fail=True), 'title', '')
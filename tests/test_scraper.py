@@ -0,0 +1,79 @@
+import json
+import sqlite3
+
+import pytest
+
+from scripts import scraper
+
+def book(title, price=10.0, rating=3, availability='5', category='Fiction'):
+    return {
+        'title': title, 'price': price, 'rating': rating, 'availability': availability,
+        'category': category, 'image_url': f'https://example.com/{title}.jpg'
+    }
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'books.db')
+    scraper.setup_database(path)
+    return path
+
+def read(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        books = {title: (book_id, price) for book_id, title, price in conn.execute('SELECT id, title, price FROM books')}
+        changes = [
+            (version, operation, json.loads(fields) if fields else None)
+            for version, operation, fields in conn.execute('SELECT version, operation, fields FROM book_changes ORDER BY id')
+        ]
+        return version, books, changes
+    finally:
+        conn.close()
+
+def test_first_save_inserts_every_book(db_path):
+    scraper.save_to_sqlite([book('A'), book('B')], complete=True, output_filepath=db_path)
+    version, books, changes = read(db_path)
+    assert version == 1
+    assert set(books) == {'A', 'B'}
+    assert changes == [(1, 'insert', None), (1, 'insert', None)]
+
+def test_changed_books_are_updated_in_place(db_path):
+    scraper.save_to_sqlite([book('A'), book('B')], complete=True, output_filepath=db_path)
+    _, before, _ = read(db_path)
+    scraper.save_to_sqlite([book('A', price=12.5), book('B')], complete=True, output_filepath=db_path)
+    version, after, changes = read(db_path)
+    assert version == 2
+    # The ID is kept, so clients can follow the book.
+    assert after['A'] == (before['A'][0], 12.5)
+    assert changes[2:] == [(2, 'update', ['price'])]
+
+def test_unchanged_scrape_keeps_the_version(db_path):
+    scraper.save_to_sqlite([book('A'), book('B')], complete=True, output_filepath=db_path)
+    scraper.save_to_sqlite([book('A'), book('B')], complete=True, output_filepath=db_path)
+    version, _, changes = read(db_path)
+    assert version == 1
+    assert len(changes) == 2
+
+def test_incomplete_scrape_does_not_delete_missing_books(db_path):
+    scraper.save_to_sqlite([book('A'), book('B')], complete=True, output_filepath=db_path)
+    scraper.save_to_sqlite([book('A'), book('C')], complete=False, output_filepath=db_path)
+    version, books, changes = read(db_path)
+    assert version == 2
+    assert set(books) == {'A', 'B', 'C'}
+    assert changes[2:] == [(2, 'insert', None)]
+
+def test_complete_scrape_deletes_missing_books(db_path):
+    scraper.save_to_sqlite([book('A'), book('B')], complete=True, output_filepath=db_path)
+    scraper.save_to_sqlite([book('A')], complete=True, output_filepath=db_path)
+    version, books, changes = read(db_path)
+    assert version == 2
+    assert set(books) == {'A'}
+    assert changes[2:] == [(2, 'delete', None)]
+
+def test_old_changes_are_pruned(db_path, monkeypatch):
+    monkeypatch.setattr(scraper, 'CHANGES_RETENTION', 2)
+    for price in (10.0, 11.0, 12.0, 13.0):
+        scraper.save_to_sqlite([book('A', price=price)], complete=True, output_filepath=db_path)
+    version, _, changes = read(db_path)
+    assert version == 4
+    assert [change[0] for change in changes] == [3, 4]
@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+from flask import Flask
+
+from api import shards
+from scripts import scraper
+
+@pytest.fixture
+def app_context(tmp_path):
+    app = Flask(__name__)
+    app.config['SHARDS'] = shards.parse_shards(str(tmp_path / 'a.db'), spec=f"b={tmp_path / 'b.db'}=http://b/,c={tmp_path / 'c.db'}")
+    with app.app_context():
+        yield
+
+def test_parse_shards():
+    parsed = shards.parse_shards('main.db', 'http://main/', 'b=b.db=http://b/, c=c.db')
+    assert [(shard.index, shard.name, shard.path, shard.base_url) for shard in parsed] == [
+        (0, shards.PRIMARY_SHARD, 'main.db', 'http://main/'), (1, 'b', 'b.db', 'http://b/'), (2, 'c', 'c.db', None)
+    ]
+    with pytest.raises(ValueError):
+        shards.parse_shards('main.db', spec='b')
+    with pytest.raises(ValueError):
+        shards.parse_shards('main.db', spec='b=b.db,b=other.db')
+
+def test_primary_shard_keeps_its_ids(app_context):
+    primary = shards.get_shards()[0]
+    assert shards.global_id(primary, 42) == 42
+    assert shards.split_id(42) == (primary, 42)
+
+@pytest.mark.parametrize('local_id', [1, 7, shards.LOCAL_ID_MASK])
+def test_global_id_round_trip(app_context, local_id):
+    for shard in shards.get_shards():
+        assert shards.split_id(shards.global_id(shard, local_id)) == (shard, local_id)
+
+def test_split_id_of_unknown_shard(app_context):
+    assert shards.split_id(3 << shards.SHARD_BITS) == (None, None)
+    assert shards.split_id(-1) == (None, None)
+
+def test_to_public_only_changes_other_shards(app_context):
+    primary, other, _ = shards.get_shards()
+    assert shards.to_public(primary, {'id': 5}) == {'id': 5}
+    assert shards.to_public(other, {'id': 5}) == {'id': (1 << shards.SHARD_BITS) | 5}
+    assert shards.to_public(other, {'title': 'A'}) == {'title': 'A'}
+
+def build_database(path, books):
+    scraper.setup_database(path)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO books (title, price, rating, availability, category, image_url) VALUES (?, ?, ?, ?, ?, ?)',
+        [(title, price, 5, '1', category, None) for title, price, category in books]
+    )
+    conn.commit()
+    conn.close()
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    build_database(str(tmp_path / 'a.db'), [('Delta', 10.0, 'Fiction'), ('Alpha', 20.0, 'Poetry')])
+    build_database(str(tmp_path / 'b.db'), [('Charlie', 30.0, 'Fiction'), ('Bravo', 40.0, 'Fiction')])
+    monkeypatch.setenv('DATABASE_PATH', str(tmp_path / 'a.db'))
+    monkeypatch.setenv('DATABASE_SHARDS', f"b={tmp_path / 'b.db'},missing={tmp_path / 'missing.db'}")
+    monkeypatch.setenv('SCRAPE_ON_BOOT', 'false')
+    monkeypatch.setenv('JWT_SECRET_KEY', 'test-secret')
+    from api.app import create_app
+    return create_app().test_client()
+
+@pytest.mark.parametrize('url', ['/api/v1/books', '/api/v1/books/top-rated', '/api/v1/books/search?title=a'])
+def test_fan_out_merges_by_title(client, url):
+    books = client.get(url).get_json()
+    assert [book['title'] for book in books] == ['Alpha', 'Bravo', 'Charlie', 'Delta']
+
+def test_fan_out_returns_public_ids(client):
+    books = {book['title']: book['id'] for book in client.get('/api/v1/books?fields=id,title').get_json()}
+    assert books['Delta'] == 1
+    assert books['Charlie'] == (1 << shards.SHARD_BITS) | 1
+    assert client.get(f"/api/v1/books/{books['Charlie']}").get_json()['title'] == 'Charlie'
+    batch = client.post('/api/v1/books/batch', json={'ids': [books['Bravo'], books['Alpha'], 99]}).get_json()
+    assert [book['title'] for book in batch['books']] == ['Bravo', 'Alpha']
+    assert batch['missing'] == [99]
+
+def test_fan_out_merges_aggregates(client):
+    overview = client.get('/api/v1/stats/overview').get_json()
+    assert overview['total_books'] == 4
+    assert overview['average_price'] == '£25.0'
+    categories = client.get('/api/v1/stats/categories').get_json()
+    assert categories['Fiction'] == {'books': 3, 'average_price': '£26.67'}
+    search = client.get('/api/v1/books/search?title=a&facets=true').get_json()
+    assert search['facets']['total_books'] == 4
+    assert search['facets']['categories']['Fiction']['books'] == 3
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from api import ml
+
+WORDS = ['dragon', 'market', 'garden', 'ocean', 'winter', 'empire', 'shadow', 'silver', 'forest', 'river', 'castle', 'journey']
+CATEGORIES = ['Fantasy', 'Business', 'Poetry']
+
+@pytest.fixture
+def index():
+    rows = [
+        (book_id, f'{WORDS[book_id % len(WORDS)]} {WORDS[book_id * 5 % len(WORDS)]} {book_id}',
+         CATEGORIES[book_id % len(CATEGORIES)], book_id % 5 + 1, 5.0 + book_id * 1.5)
+        for book_id in range(1, 61)
+    ]
+    return ml.SimilarBooksIndex(rows, version=1)
+
+def brute_force(index, book_id, k):
+    # Cosine of the weighted book vectors against every other book, without candidate generation.
+    categories = np.eye(len(index.categories), dtype=np.float32)[index.category_codes]
+    vectors = np.hstack([
+        ml.WEIGHTS['title'] * index.titles.toarray(), ml.WEIGHTS['category'] * categories,
+        ml.WEIGHTS['rating'] * index.ratings[:, None], ml.WEIGHTS['price'] * index.prices[:, None]
+    ])
+    vectors /= np.linalg.norm(vectors, axis=1)[:, None]
+    row = int(np.flatnonzero(index.ids == book_id)[0])
+    scores = vectors @ vectors[row]
+    scores[row] = -np.inf
+    top = np.argsort(-scores, kind='stable')[:k]
+    return [(int(index.ids[i]), float(scores[i])) for i in top]
+
+@pytest.mark.parametrize('book_id', [1, 17, 42, 60])
+def test_similar_matches_brute_force_cosine(index, book_id):
+    k = 5
+    result = index.similar([book_id], k)[0]
+    expected = brute_force(index, book_id, k)
+    # Same scores in the same order; ties may list their books in another order.
+    assert [score for _, score in result] == pytest.approx([score for _, score in expected], abs=1e-4)
+    scores = dict(brute_force(index, book_id, len(index)))
+    for similar_id, score in result:
+        assert similar_id != book_id
+        assert score == pytest.approx(scores[similar_id], abs=1e-4)
+
+def test_similar_is_batched(index):
+    assert index.similar([17, 42], 3) == [index.similar([17], 3)[0], index.similar([42], 3)[0]]
+
+def test_unknown_ids_are_none(index):
+    assert index.similar([0, 61, -1, 2 ** 63, 2 ** 70, 17], 3)[:5] == [None] * 5
+    assert index.similar([17], 3)[0] is not None
+    assert ml.SimilarBooksIndex([]).similar([1], 3) == [None]